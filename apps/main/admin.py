@@ -1,23 +1,38 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
 from django.utils.safestring import mark_safe
+from django.utils.html import format_html
+from django.urls import path, reverse
 from django.utils import timezone
-from django.db.models import Sum, F, Q, DecimalField, ExpressionWrapper
+from django.db.models import Count, Sum, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect
 from django.shortcuts import render
-from django.http import HttpResponse
-from django.utils.timezone import now
-from datetime import timedelta
+from datetime import datetime, time
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from rangefilter.filters import NumericRangeFilterBuilder
 
-from .models import Warehouse, Country, Brand, Product, Arrival, ArrivalProduct, CurrencyRate
-from .utils import convert_from_usd
-from .filters import SoldQuantityFilter, SalePeriodFilter
+from apps.sales.models import ProductSalesDay
+
+from .models import (Warehouse, Country, Brand, Product, Arrival, ArrivalProduct, CurrencyRate, ReportJob,
+                     StockMovement)
+from .utils import format_currency
+from .classification import classify_products
+from .currency import converted
+from .exports import reorder_report, warehouse_stock_report
+from .reorder import reorder_suggestions
+from .reports import queue_report_action, report_title
+from .stock import save_arrival_items
+from .filters import SoldQuantityFilter, SalePeriodFilter, VehicleFilter, sale_period_start
+from .forms import ReorderForm, StockAsOfForm
+from .pagination import KeysetPaginationMixin
+from .search import ArticleSearchMixin, VehicleSearchMixin
+from .widgets import ProductAutocompleteMixin
 
 
 @admin.register(ArrivalProduct)
-class ArrivalProductAdmin(admin.ModelAdmin):
+class ArrivalProductAdmin(ArticleSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'article_number', 'arrival__date', 'show_quantity', 'cost_price_converted', 
                     'total_cost_converted', 'brand__name', 'suits_for')
     list_display_links = ('name', 'article_number')
@@ -35,20 +50,26 @@ class ArrivalProductAdmin(admin.ModelAdmin):
             )
         return () 
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_converted(
+            converted_cost_price='cost_price',
+            converted_total_cost=F('quantity') * F('cost_price'),
+        )
+
+    @admin.display(description="Себестоимость", ordering='converted_cost_price')
     def cost_price_converted(self, obj):
-        return convert_from_usd(obj.cost_price)
-    cost_price_converted.short_description = "Себестоимость"
+        return format_currency(obj.converted_cost_price)
 
+    @admin.display(description="Общая стоимость", ordering='converted_total_cost')
     def total_cost_converted(self, obj):
-        return convert_from_usd(obj.total_cost)
-    total_cost_converted.short_description = "Общая стоимость"
+        return format_currency(obj.converted_total_cost)
 
     @admin.display(description='Количество')
     def show_quantity(self, obj):
         return f"{obj.quantity} шт."
 
 
-class ArrivalProductInline(admin.TabularInline):
+class ArrivalProductInline(ProductAutocompleteMixin, admin.TabularInline):
     model = ArrivalProduct
     extra = 5
     
@@ -63,7 +84,7 @@ class ArrivalProductInline(admin.TabularInline):
         'suits_for',
     )
     readonly_fields = ('row_total',)
-    autocomplete_fields = ('product', 'brand',)
+    autocomplete_fields = ('brand',)
     can_delete = False
 
     def row_total(self, obj):
@@ -96,169 +117,60 @@ class ArrivalProductInline(admin.TabularInline):
 class ArrivalAdmin(admin.ModelAdmin):
     list_display = ('id', 'date', 'warehouse__name', 'country_of_origin', 'total_amount_converted', 'comment')
     list_display_links = ('id', 'date')
-    list_filter = ('warehouse__name', 'date')
+    list_filter = ('warehouse__name', 'date', ('total_amount', NumericRangeFilterBuilder()))
     search_fields = ('id', 'warehouse__name', 'date')
     inlines = [ArrivalProductInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_converted(converted_total_amount='total_amount')
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ArrivalProduct:
+            return super().save_formset(request, form, formset, change)
+
+        # Post all lines in bulk instead of one signal round trip per row.
+        save_arrival_items(form.instance, formset.save(commit=False))
+
+    @admin.display(description="Общая сумма", ordering='total_amount')
     def total_amount_converted(self, obj):
-        return convert_from_usd(obj.total_amount)
-    total_amount_converted.short_description = "Общая сумма"
+        return format_currency(obj.converted_total_amount)
 
     class Media:
         js = (
             'admin/js/arrival_totals.js', 
             "admin/js/inline_keyboard_nav.js",
+            "admin/js/product_autofill_loader.js",
             "admin/js/arrival_product_autofill.js",
         )
 
 
 @admin.action(description='Экспорт остатков склада в Excel')
 def export_warehouse_stock_to_excel(modeladmin, request, queryset):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Остатки склада"
-
-    bold = Font(bold=True)
-    center = Alignment(horizontal='center')
-    left = Alignment(horizontal='left')
-
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin'),
-    )
+    warehouse_text = request.GET.get('warehouse__name') or "Все склады"
 
-    # ================= FILTER: ONLY quantity > 0 =================
-    queryset = queryset.filter(quantity__gt=0).select_related(
-        'warehouse', 'brand', 'country_of_origin'
-    )
+    report = warehouse_stock_report(queryset, warehouse_text)
+    return report.response("warehouse_stock.xlsx")
 
-    # ================= WAREHOUSE INFO =================
-    warehouse_ids = request.GET.get('warehouse__name')
-    print(warehouse_ids, 'edcedc', request.GET, )
-    if warehouse_ids:
-        warehouse_text = warehouse_ids
-    else:
-        warehouse_text = "Все склады"
-
-    # ================= DATE OF GENERATION =================
-    generated_at = now().strftime('%Y-%m-%d %H:%M')
-
-    # ================= TOTALS =================
-    total_positions = queryset.count()
-    total_quantity = sum(p.quantity for p in queryset)
-
-    total_cost_amount = queryset.aggregate(
-        total=Sum(
-            ExpressionWrapper(
-                F('quantity') * F('cost_price'),
-                output_field=DecimalField(max_digits=15, decimal_places=2)
-            )
-        )
-    )['total'] or 0
-
-    # ================= TOP INFO =================
-    ws.merge_cells('A1:H1')
-    ws['A1'] = f"Склад: {warehouse_text}"
-    ws['A1'].font = bold
-    ws['A1'].alignment = left
-
-    ws.merge_cells('A2:H2')
-    ws['A2'] = f"Дата формирования отчёта: {generated_at}"
-    ws['A2'].font = bold
-    ws['A2'].alignment = left
-
-    ws.merge_cells('A3:H3')
-    ws['A3'] = f"Всего позиций: {total_positions} | Общее количество: {total_quantity}"
-    ws['A3'].font = bold
-    ws['A3'].alignment = left
-
-    ws.merge_cells('A4:H4')
-    ws['A4'] = (
-        f"Общая себестоимость: {total_cost_amount:.2f} | "
-    )
-    ws['A4'].font = bold
-    ws['A4'].alignment = left
-
-    # ================= HEADERS =================
-    headers = [
-        "Товар",
-        "Артикул",
-        "Склад",
-        "Бренд",
-        "Страна",
-        "Количество",
-        "Себестоимость",
-        "Цена продажи",
-    ]
-
-    ws.append([])
-    ws.append(headers)
-
-    header_row = ws.max_row
-
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = bold
-        cell.alignment = center
-        cell.border = thin_border
-
-    # ================= DATA =================
-    for product in queryset:
-        ws.append([
-            product.name,
-            product.article_number or '',
-            product.warehouse.name,
-            product.brand.name,
-            product.country_of_origin.name,
-            product.quantity,
-            float(product.cost_price) if product.cost_price else '',
-            float(product.selling_price) if product.selling_price else '',
-        ])
-
-    # ================= BODY STYLE =================
-    for row in ws.iter_rows(min_row=header_row + 1, max_row=ws.max_row):
-        for cell in row:
-            cell.border = thin_border
-            cell.alignment = left if cell.column in [1, 3, 4, 5] else center
-
-    # ================= AUTO WIDTH =================
-    for column_cells in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(column_cells[0].column)
-
-        for cell in column_cells:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    # ================= RESPONSE =================
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="warehouse_stock.xlsx"'
-    wb.save(response)
 
-    return response
+@admin.action(description='Экспорт остатков склада в Excel (в фоне)')
+def export_warehouse_stock_in_background(modeladmin, request, queryset):
+    warehouse_text = request.GET.get('warehouse__name') or "Все склады"
+
+    queue_report_action(modeladmin, request, 'warehouse_stock', queryset, warehouse_text)
 
 
 @admin.action(description="💰 Показать общую себестоимость")
 def show_total_cost_price(modeladmin, request, queryset):
 
     total_cost = queryset.aggregate(
-        total=Sum(
-            ExpressionWrapper(
-                F('quantity') * F('cost_price'),
-                output_field=DecimalField(max_digits=15, decimal_places=2)
-            )
-        )
-    )['total'] or 0
+        total=converted(Sum(F('quantity') * F('cost_price'), default=0))
+    )['total']
 
     context = {
-        'products': queryset.select_related('warehouse', 'brand'),
-        'total_cost': convert_from_usd(total_cost),
+        'products': queryset.select_related('warehouse', 'brand').with_converted(
+            converted_cost_price='cost_price',
+        ),
+        'total_cost': format_currency(total_cost),
     }
 
     return render(
@@ -269,18 +181,20 @@ def show_total_cost_price(modeladmin, request, queryset):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(KeysetPaginationMixin, ArticleSearchMixin, VehicleSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'article_number', 'brand__name', 'country_of_origin', 'warehouse',  
                     'show_quantity', 'sold_quantity', 'cost_price_converted', 'suits_for')
     list_display_links = ('name', 'article_number')
     search_fields = ('name', 'article_number')
     list_filter = ('warehouse__name', 'country_of_origin__name', SoldQuantityFilter,
-                   SalePeriodFilter, 'brand__name',)
-    actions = (export_warehouse_stock_to_excel, show_total_cost_price)
+                   SalePeriodFilter, 'brand__name', VehicleFilter, 'abc_class', 'xyz_class',
+                   'value_class', 'stock_class')
+    actions = (export_warehouse_stock_to_excel, export_warehouse_stock_in_background, show_total_cost_price)
+    keyset_ordering = ('name', 'pk')
     
+    @admin.display(description="Себестоимость", ordering='converted_cost_price')
     def cost_price_converted(self, obj):
-        return convert_from_usd(obj.cost_price)
-    cost_price_converted.short_description = "Себестоимость"
+        return format_currency(obj.converted_cost_price)
 
     # def get_search_results(self, request, queryset, search_term):
     #     queryset, use_distinct = super().get_search_results(
@@ -304,33 +218,19 @@ class ProductAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
 
-        period = request.GET.get('period')
-        now = timezone.now()
-
-        sold_filter = Q()
-
-        if period == 'today':
-            sold_filter = Q(sale_items__sale__sale_date__gte=now.replace(
-                hour=0, minute=0, second=0, microsecond=0
-            ))
-
-        elif period == 'week':
-            start = now - timedelta(days=now.weekday())
-            sold_filter = Q(sale_items__sale__sale_date__gte=start)
-
-        elif period == 'month':
-            sold_filter = Q(sale_items__sale__sale_date__gte=now.replace(day=1))
-
-        elif period == 'year':
-            sold_filter = Q(sale_items__sale__sale_date__gte=now.replace(month=1, day=1))
+        # Sold quantity comes from the daily sales rollup rather than a join
+        # over every sale line of the product.
+        sold = ProductSalesDay.objects.filter(product=OuterRef('pk'))
+        start = sale_period_start(request.GET.get('period'))
+        if start is not None:
+            sold = sold.filter(day__gte=start)
 
         return qs.annotate(
-            active_sold_qty=Sum(
-                'sale_items__quantity',
-                filter=sold_filter,
-                default=0
+            active_sold_qty=Coalesce(
+                Subquery(sold.values('product').annotate(total=Sum('quantity')).values('total').order_by()),
+                0,
             )
-        )
+        ).with_converted(converted_cost_price='cost_price')
 
     @admin.display(description="Продано", ordering='active_sold_qty')
     def sold_quantity(self, obj):
@@ -343,7 +243,152 @@ class ProductAdmin(admin.ModelAdmin):
     def get_ordering(self, request):
         if request.GET.get('sold') in ('most', 'least'):
             return ()
-        return ('name',)
+        return self.keyset_ordering
+
+    # Sales and arrivals move these with F() updates while the form is open.
+    stock_fields = ('quantity', 'cost_price')
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if db_field.name in self.stock_fields:
+            # Compare the submitted value with the one the user saw, not with
+            # the stock at the time of saving.
+            formfield.show_hidden_initial = True
+        return formfield
+
+    def save_model(self, request, obj, form, change):
+        # Stock values the user did not touch are stale and are not written
+        # back, or they would undo the concurrent moves and be recorded as a
+        # stock adjustment.
+        untouched = set(self.stock_fields) - set(form.changed_data)
+        if change and untouched:
+            obj.save(update_fields=[
+                field.name for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name not in untouched
+            ])
+        else:
+            super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        return [
+            path('stock-as-of/', self.admin_site.admin_view(self.stock_as_of_view),
+                 name='main_product_stock_as_of'),
+            path('reorder/', self.admin_site.admin_view(self.reorder_view), name='main_product_reorder'),
+            path('classification/', self.admin_site.admin_view(self.classification_view),
+                 name='main_product_classification'),
+        ] + super().get_urls()
+
+    def stock_as_of_view(self, request):
+        """Stock of every product at the end of a given day, from the stock ledger."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        form = StockAsOfForm(request.GET or None)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Остатки на дату",
+            'opts': self.model._meta,
+            'form': form,
+        }
+
+        if form.is_valid():
+            moment = timezone.make_aware(datetime.combine(form.cleaned_data['date'], time.max))
+            products = Product.objects.as_of(moment).filter(stock_as_of__gt=0)
+            if form.cleaned_data['warehouse']:
+                products = products.filter(warehouse=form.cleaned_data['warehouse'])
+
+            query = request.GET.copy()
+            query.pop('page', None)
+            context.update(
+                products.aggregate(total_positions=Count('pk'), total_quantity=Sum('stock_as_of', default=0)),
+                page=Paginator(
+                    products.select_related('warehouse', 'brand').order_by('name', 'pk'), 100
+                ).get_page(request.GET.get('page')),
+                query=query.urlencode(),
+            )
+
+        return render(request, 'admin/products/stock_as_of.html', context)
+
+    def reorder_view(self, request):
+        """What to order per warehouse, from the sales velocity of every product."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        form = ReorderForm(request.GET or None)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Заказ по скорости продаж",
+            'opts': self.model._meta,
+            'form': form,
+        }
+
+        if form.is_valid():
+            warehouse = form.cleaned_data['warehouse']
+            products = Product.objects.select_related('warehouse', 'brand')
+            if warehouse:
+                products = products.filter(warehouse=warehouse)
+
+            if 'export' in request.GET:
+                report = reorder_report(products, warehouse or "Все склады", form.reorder_params())
+                return report.response("reorder.xlsx")
+
+            query = request.GET.copy()
+            query.pop('page', None)
+            context.update(
+                page=Paginator(
+                    reorder_suggestions(products, **form.reorder_params()), 100
+                ).get_page(request.GET.get('page')),
+                query=query.urlencode(),
+            )
+
+        return render(request, 'admin/products/reorder.html', context)
+
+    def classification_view(self, request):
+        """Products and stock value per ABC/XYZ class, per stock value class and per stock class."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            if not self.has_change_permission(request):
+                raise PermissionDenied
+            classified = classify_products()
+            self.message_user(request, f"Классифицировано товаров: {classified}", messages.SUCCESS)
+            return HttpResponseRedirect(request.path)
+
+        sums = {
+            'products': Count('pk'),
+            'value': converted(Sum(F('quantity') * F('cost_price'), default=0)),
+        }
+        cells = {
+            (row['abc_class'], row['xyz_class']): row
+            for row in Product.objects.values('abc_class', 'xyz_class').annotate(**sums).order_by()
+        }
+        value = {
+            row['value_class']: row
+            for row in Product.objects.values('value_class').annotate(**sums).order_by()
+        }
+        stock = {
+            row['stock_class']: row
+            for row in Product.objects.values('stock_class').annotate(**sums).order_by()
+        }
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Классификация товаров",
+            'opts': self.model._meta,
+            'xyz_classes': Product.XYZ_CLASSES,
+            'matrix': [
+                (abc_class, label, [
+                    (xyz_class, cells.get((abc_class, xyz_class))) for xyz_class, _ in Product.XYZ_CLASSES
+                ])
+                for abc_class, label in Product.ABC_CLASSES
+            ],
+            'value': [(value_class, label, value.get(value_class)) for value_class, label in Product.VALUE_CLASSES],
+            'stock': [(stock_class, label, stock.get(stock_class)) for stock_class, label in Product.STOCK_CLASSES],
+            'unclassified': cells.get(('', '')),
+            'can_classify': self.has_change_permission(request),
+        }
+        return render(request, 'admin/products/classification.html', context)
 
 
 @admin.register(Warehouse)
@@ -351,11 +396,14 @@ class WarehouseAdmin(admin.ModelAdmin):
     list_display = ('name', 'total_products_type', 'total_quantity_of_goods')
     search_fields = ('name',)
 
-    @admin.display(description='Количество видов товаров')
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock_totals()
+
+    @admin.display(description='Количество видов товаров', ordering='products_type_count')
     def total_products_type(self, obj):
         return obj.total_products_type
     
-    @admin.display(description='Общее количество товаров')
+    @admin.display(description='Общее количество товаров', ordering='products_quantity_sum')
     def total_quantity_of_goods(self, obj):
         return obj.total_quantity_of_goods
 
@@ -389,4 +437,67 @@ class CurrencyRateAdmin(admin.ModelAdmin):
     list_display = ('currency_code', 'rate_to_usd', 'last_updated', 'selected')
     search_fields = ('currency_code',)
     list_filter = ('last_updated',)
-    list_editable = ('selected',)
\ No newline at end of file
+    list_editable = ('selected',)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'quantity', 'kind', 'arrival_item', 'sale_item')
+    list_filter = ('kind', 'created_at', 'product__warehouse__name')
+    search_fields = ('product__name', 'product__article_number')
+    list_select_related = ('product__warehouse', 'arrival_item', 'sale_item__product', 'sale_item__sale')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'report', 'status_display', 'progress_display', 'created_by', 'created_at',
+                    'finished_at', 'download')
+    list_filter = ('status', 'kind', 'created_at')
+    readonly_fields = ('kind', 'status', 'progress', 'model', 'selected_rows', 'result', 'error', 'created_by',
+                       'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+    exclude = ('params',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Выбрано строк")
+    def selected_rows(self, obj):
+        return len(obj.params.get('pks', []))
+
+    @admin.display(description='Отчёт', ordering='kind')
+    def report(self, obj):
+        return report_title(obj.kind)
+
+    @admin.display(description='Статус', ordering='status')
+    def status_display(self, obj):
+        # Pending and running rows make the changelist refresh itself.
+        return format_html(
+            '<span class="report-job-status" data-active="{}">{}</span>',
+            int(obj.status in ('pending', 'running')), obj.get_status_display(),
+        )
+
+    @admin.display(description='Прогресс')
+    def progress_display(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {}%', obj.progress, obj.progress)
+
+    @admin.display(description='Файл')
+    def download(self, obj):
+        if obj.status != 'done':
+            return "-"
+        return format_html('<a href="{}">Скачать</a>', reverse('report_job_download', args=[obj.pk]))
+
+    class Media:
+        js = ("admin/js/report_jobs_refresh.js",)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class MainConfig(AppConfig):
@@ -7,3 +8,8 @@ class MainConfig(AppConfig):
 
     def ready(self):
         import apps.main.signals 
+        from apps.main.dedup import merge_before_stock_key_constraint
+        from apps.main.search import create_trigram_indexes
+
+        pre_migrate.connect(merge_before_stock_key_constraint, sender=self)
+        post_migrate.connect(create_trigram_indexes, sender=self)
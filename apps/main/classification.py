@@ -0,0 +1,168 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from apps.sales.models import ProductSalesDay
+
+from .excel import CHUNK_SIZE
+from .models import ArrivalProduct, Product, StockMovement
+
+
+WINDOW_DAYS = 365
+BUCKET_DAYS = 7
+
+# Cumulative share (of revenue or of stock value) closing the A and B classes.
+A_SHARE, B_SHARE = 0.80, 0.95
+# Coefficient of variation of the demand per bucket closing X and Y.
+X_CV, Y_CV = 0.5, 1.0
+# Days without a sale after which stock is slow, then dead.
+SLOW_DAYS, DEAD_DAYS = 90, 180
+
+
+def abc_classes(weights):
+    """A for the products making the first 80% of ``weights``, B for the next 15%, C for the rest."""
+    order = np.argsort(-weights, kind='stable')
+    ranked_weights = weights[order]
+    total = ranked_weights.sum()
+
+    classes = np.full(len(weights), 'C', dtype='<U1')
+    if total <= 0:
+        return classes
+
+    share_before = (np.cumsum(ranked_weights) - ranked_weights) / total
+    ranked = np.where(share_before < A_SHARE, 'A', np.where(share_before < B_SHARE, 'B', 'C'))
+    ranked[ranked_weights <= 0] = 'C'
+    classes[order] = ranked
+    return classes
+
+
+def xyz_classes(demand):
+    """X, Y or Z by the variation of ``demand``, a products × buckets matrix of units sold."""
+    mean = demand.mean(axis=1)
+    cv = np.divide(demand.std(axis=1), mean, out=np.full(len(mean), np.inf), where=mean > 0)
+    return np.where(cv <= X_CV, 'X', np.where(cv <= Y_CV, 'Y', 'Z'))
+
+
+def stock_classes(quantity, idle_days):
+    """Active, slow or dead stock by the days since the last sale; nothing for products out of stock."""
+    return np.where(
+        quantity <= 0, '',
+        np.where(idle_days >= DEAD_DAYS, 'dead', np.where(idle_days >= SLOW_DAYS, 'slow', 'active')),
+    )
+
+
+def days_before(today, days):
+    return (np.datetime64(today) - np.array(days, dtype='datetime64[D]')).astype(int)
+
+
+def rows_of(product_ids, ids):
+    """
+    Rows of ``ids`` in the sorted ``product_ids``, with a mask of the ids
+    found there: products created since the catalog was read are not.
+    """
+    ids = np.asarray(ids)
+    rows = np.searchsorted(product_ids, ids)
+    found = rows < len(product_ids)
+    found[found] = product_ids[rows[found]] == ids[found]
+    return rows[found], found
+
+
+def idle_days(product_ids, today):
+    """
+    Days since the last sale of every product. A product never sold counts
+    from when it came in, its last arrival or its first stock movement
+    (made when it was created), so new arrivals are not dead stock. With
+    none of these on record it has been on the shelf since before the
+    records and counts as dead.
+    """
+    idle = np.full(len(product_ids), DEAD_DAYS)
+
+    last_arrivals = list(
+        ArrivalProduct.objects.values('product').annotate(last=Max('arrival__date')).order_by()
+        .values_list('product', 'last').iterator(CHUNK_SIZE)
+    )
+    if last_arrivals:
+        arrived_ids, lasts = zip(*last_arrivals)
+        rows, found = rows_of(product_ids, arrived_ids)
+        idle[rows] = days_before(today, lasts)[found]
+
+    first_moves = list(
+        StockMovement.objects.values('product').annotate(first=Min('created_at')).order_by()
+        .values_list('product', 'first').iterator(CHUNK_SIZE)
+    )
+    if first_moves:
+        moved_ids, firsts = zip(*first_moves)
+        rows, found = rows_of(product_ids, moved_ids)
+        idle[rows] = np.minimum(idle[rows], days_before(today, [timezone.localdate(first) for first in firsts])[found])
+
+    last_sales = list(
+        ProductSalesDay.objects.filter(quantity__gt=0).values('product').annotate(last=Max('day')).order_by()
+        .values_list('product', 'last').iterator(CHUNK_SIZE)
+    )
+    if last_sales:
+        sold_ids, lasts = zip(*last_sales)
+        rows, found = rows_of(product_ids, sold_ids)
+        idle[rows] = days_before(today, lasts)[found]
+
+    return idle
+
+
+def classify_products(window_days=WINDOW_DAYS, bucket_days=BUCKET_DAYS):
+    """
+    Classify the whole catalog in one vectorized pass and store the classes
+    on Product: ABC by revenue share and XYZ by the variation of demand over
+    the last ``window_days`` (in buckets of ``bucket_days``), ABC by the
+    value of the stock (quantity × cost price), the capital it ties up, and
+    the active/slow/dead stock class. Returns the number of products.
+
+    The window is cut to whole buckets and ends yesterday: a short last
+    bucket, or today's sales still coming in, would make every product
+    look more variable than it is.
+    """
+    today = timezone.localdate()
+    buckets = max(window_days // bucket_days, 1)
+    window_days = buckets * bucket_days
+    end = today - timedelta(days=1)
+    start = end - timedelta(days=window_days - 1)
+
+    products = list(Product.objects.order_by('pk').values_list('pk', 'quantity', 'cost_price'))
+    if not products:
+        return 0
+    product_ids, quantity, cost_price = zip(*products)
+    product_ids, quantity = np.array(product_ids), np.array(quantity)
+    stock_value = quantity * np.array([cost or 0 for cost in cost_price], dtype=float)
+
+    sales = list(
+        ProductSalesDay.objects.filter(day__gte=start, day__lte=end)
+        .values_list('product', 'day', 'quantity', 'revenue').iterator(CHUNK_SIZE)
+    )
+    revenue = np.zeros(len(product_ids))
+    demand = np.zeros((len(product_ids), buckets))
+    if sales:
+        sold_ids, days, units, amounts = zip(*sales)
+        rows, found = rows_of(product_ids, sold_ids)
+        columns = (window_days - 1 - days_before(end, days)[found]) // bucket_days
+        revenue = np.bincount(rows, weights=np.array(amounts, dtype=float)[found], minlength=len(product_ids))
+        np.add.at(demand, (rows, columns), np.array(units, dtype=float)[found])
+
+    classes = np.stack([
+        abc_classes(revenue),
+        xyz_classes(demand),
+        abc_classes(stock_value),
+        stock_classes(quantity, idle_days(product_ids, today)),
+    ], axis=1)
+
+    # One UPDATE per combination of classes instead of one per product.
+    combinations, groups = np.unique(classes, axis=0, return_inverse=True)
+    with transaction.atomic():
+        for group, (abc_class, xyz_class, value_class, stock_class) in enumerate(combinations):
+            pks = product_ids[groups.ravel() == group].tolist()
+            for offset in range(0, len(pks), CHUNK_SIZE):
+                Product.objects.filter(pk__in=pks[offset:offset + CHUNK_SIZE]).update(
+                    abc_class=abc_class, xyz_class=xyz_class, value_class=value_class, stock_class=stock_class,
+                )
+
+    return len(product_ids)
@@ -0,0 +1,28 @@
+import re
+
+from .models import ProductCompatibility
+from .utils import normalize_name
+
+
+SEPARATORS = re.compile(r'[,;\n]+')
+
+
+def parse_vehicles(suits_for):
+    """'Camry 40, Corolla 150; rav4' -> {'CAMRY 40', 'COROLLA 150', 'RAV4'}"""
+    if not suits_for:
+        return set()
+    return {vehicle for vehicle in map(normalize_name, SEPARATORS.split(suits_for)) if vehicle}
+
+
+def compatibility_rows(products):
+    return [
+        ProductCompatibility(product_id=product.pk, vehicle=vehicle[:100])
+        for product in products
+        for vehicle in sorted(parse_vehicles(product.suits_for))
+    ]
+
+
+def sync_compatibility(products):
+    """Replace the compatibility rows of ``products`` with those of their suits_for."""
+    ProductCompatibility.objects.filter(product_id__in=[product.pk for product in products]).delete()
+    ProductCompatibility.objects.bulk_create(compatibility_rows(products))
@@ -1,7 +1,11 @@
-from apps.main.models import CurrencyRate
+from django.utils.functional import SimpleLazyObject
+
+from apps.main.currency import get_currency_context
 
 def admin_currency(request):
+    # Lazy: pages that never render the currency switcher never touch the rates.
+    currency = get_currency_context()
     return {
-        "admin_currencies": CurrencyRate.objects.all(),
-        "admin_currency_selected": CurrencyRate.objects.filter(selected=True).first(),
+        "admin_currencies": SimpleLazyObject(lambda: currency.rates),
+        "admin_currency_selected": SimpleLazyObject(lambda: currency.selected),
     }
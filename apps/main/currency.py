@@ -0,0 +1,135 @@
+import threading
+import uuid
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Round
+
+from .models import CurrencyRate
+
+
+_current_context = ContextVar('currency_context', default=None)
+
+MONEY_FIELD = DecimalField(max_digits=15, decimal_places=2)
+
+VERSION_CACHE_KEY = 'currency_rates_version'
+
+
+class CurrencyRegistry:
+    """
+    Currency rates shared by every request of the process.
+
+    Loaded lazily and kept until some process bumps the version stored in
+    Django's cache (``invalidate``), so in steady state reading the rates
+    costs a cache lookup and no queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._rates = None
+
+    def current_version(self):
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_CACHE_KEY)
+        return version
+
+    @property
+    def rates(self):
+        version = self.current_version()
+        with self._lock:
+            if self._rates is None or version != self._version:
+                self._rates = tuple(CurrencyRate.objects.all())
+                self._version = version
+            return self._rates
+
+    def invalidate(self):
+        """Make every process reload the rates. Call after the change is committed."""
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._rates = None
+
+
+currency_registry = CurrencyRegistry()
+
+
+class CurrencyContext:
+    """
+    Currency rates taken from the registry at most once per request.
+
+    Every converted cell of a changelist reads the selected rate from here,
+    so a request sees one consistent set of rates.
+    """
+
+    def __init__(self):
+        self._rates = None
+
+    @property
+    def rates(self):
+        if self._rates is None:
+            self._rates = currency_registry.rates
+        return self._rates
+
+    @property
+    def selected(self):
+        return next((rate for rate in self.rates if rate.selected), None)
+
+    def invalidate(self):
+        self._rates = None
+
+
+def activate_currency_context():
+    return _current_context.set(CurrencyContext())
+
+
+def deactivate_currency_context(token):
+    _current_context.reset(token)
+
+
+def get_currency_context():
+    context = _current_context.get()
+    if context is None:
+        # Outside of a request (shell, management commands) every call
+        # checks the registry version again.
+        return CurrencyContext()
+    return context
+
+
+def invalidate_currency_rates():
+    """Drop the rates cached by this request and, once committed, by every process."""
+    get_currency_context().invalidate()
+    transaction.on_commit(currency_registry.invalidate)
+
+
+def get_selected_currency():
+    return get_currency_context().selected
+
+
+def converted(amount):
+    """
+    SQL expression converting a USD amount to the selected currency.
+
+    ``amount`` is a field name or an expression (aggregates included). The
+    result is rounded to cents like ``convert_from_usd`` does, so annotated
+    values can be sorted, filtered and summed by the database.
+    """
+    if isinstance(amount, str):
+        amount = F(amount)
+
+    selected_currency = get_selected_currency()
+
+    if not selected_currency:
+        return ExpressionWrapper(amount, output_field=MONEY_FIELD)
+
+    return Round(
+        ExpressionWrapper(
+            amount * Value(selected_currency.rate_to_usd),
+            output_field=MONEY_FIELD,
+        ),
+        precision=2,
+        output_field=MONEY_FIELD,
+    )
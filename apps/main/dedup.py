@@ -0,0 +1,177 @@
+import sys
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, transaction
+from django.db.migrations.operations import AddConstraint
+from django.db.models import Count, F, Min, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .compatibility import parse_vehicles
+from .stock import average_cost
+from .utils import normalize_article
+from apps.sales.rollups import ROLLUP_FIELDS
+
+
+STOCK_KEY = ('warehouse', 'country_of_origin', 'name', 'brand', 'stock_article')
+
+STOCK_KEY_CONSTRAINT = 'product_unique_stock_key'
+
+# Fields filled from a duplicate when the kept Product has no value.
+FILLED_FIELDS = ('article_number', 'selling_price', 'suits_for')
+
+# Models repointed from the duplicates to the kept Product.
+PRODUCT_LINES = (('main', 'ArrivalProduct'), ('main', 'StockMovement'), ('sales', 'SaleItem'))
+
+
+# Written against an app registry like a RunPython function, since it also
+# runs on the historical models of a database that is being migrated: models
+# and fields that the database does not have yet are skipped.
+
+def get_model(apps, app_label, model_name):
+    try:
+        return apps.get_model(app_label, model_name)
+    except LookupError:
+        return None
+
+
+def has_field(model, name):
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def duplicate_groups(apps, using):
+    """Stock keys shared by more than one Product, with the oldest pk of each."""
+    Product = apps.get_model('main', 'Product')
+    return (
+        Product.objects.using(using)
+        .annotate(stock_article=Coalesce('article_number', Value('')))
+        .values(*STOCK_KEY)
+        .annotate(rows=Count('pk'), keep_pk=Min('pk'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+
+
+def merge_group(apps, using, group):
+    """
+    Fold every Product of ``group`` into the oldest one: quantities are
+    summed and costs averaged by quantity, sale and arrival lines and stock
+    movements are repointed, daily sales rollups added up, the duplicates
+    deleted. Snapshots of the group no longer add up and are
+    dropped; historical stock then comes from the movements alone.
+    """
+    Product = apps.get_model('main', 'Product')
+    products = list(
+        Product.objects.using(using).select_for_update()
+        .annotate(stock_article=Coalesce('article_number', Value('')))
+        .filter(**{field: group[field] for field in STOCK_KEY})
+        .order_by('pk')
+    )
+    keep, duplicates = products[0], products[1:]
+    duplicate_pks = [product.pk for product in duplicates]
+
+    for product in duplicates:
+        if product.cost_price is not None:
+            keep.cost_price = average_cost(
+                keep.quantity, keep.cost_price, product.quantity,
+                product.quantity * product.cost_price, product.cost_price,
+            )
+        keep.quantity += product.quantity
+        for field in FILLED_FIELDS:
+            if not getattr(keep, field):
+                setattr(keep, field, getattr(product, field))
+
+    for app_label, model_name in PRODUCT_LINES:
+        model = get_model(apps, app_label, model_name)
+        if model is not None:
+            model.objects.using(using).filter(product_id__in=duplicate_pks).update(product=keep)
+
+    StockSnapshot = get_model(apps, 'main', 'StockSnapshot')
+    if StockSnapshot is not None:
+        StockSnapshot.objects.using(using).filter(product_id__in=[keep.pk] + duplicate_pks).delete()
+
+    ProductSalesDay = get_model(apps, 'sales', 'ProductSalesDay')
+    if ProductSalesDay is not None:
+        # Deleting the duplicates cascades to their daily sales rollup rows.
+        days = ProductSalesDay.objects.using(using)
+        for day, *totals in days.filter(product_id__in=duplicate_pks).values_list('day', *ROLLUP_FIELDS):
+            increments = {field: F(field) + value for field, value in zip(ROLLUP_FIELDS, totals)}
+            if not days.filter(product_id=keep.pk, day=day).update(**increments):
+                days.create(product_id=keep.pk, day=day, **dict(zip(ROLLUP_FIELDS, totals)))
+
+    Product.objects.using(using).filter(pk__in=duplicate_pks).delete()
+
+    # A queryset update: the moved quantity is not a new ledger adjustment.
+    changes = dict(quantity=keep.quantity, cost_price=keep.cost_price,
+                   **{field: getattr(keep, field) for field in FILLED_FIELDS})
+    if has_field(Product, 'article_key'):
+        changes['article_key'] = normalize_article(keep.article_number)
+    if has_field(Product, 'updated_at'):
+        changes['updated_at'] = timezone.now()
+    Product.objects.using(using).filter(pk=keep.pk).update(**changes)
+
+    ProductCompatibility = get_model(apps, 'main', 'ProductCompatibility')
+    if ProductCompatibility is not None:
+        compatibility = ProductCompatibility.objects.using(using)
+        compatibility.filter(product_id=keep.pk).delete()
+        compatibility.bulk_create(
+            ProductCompatibility(product_id=keep.pk, vehicle=vehicle[:100])
+            for vehicle in sorted(parse_vehicles(keep.suits_for))
+        )
+
+    return keep, duplicates
+
+
+def merge_duplicates(apps, using):
+    """Merge every group of duplicate Products, one transaction per group."""
+    merged = []
+    for group in duplicate_groups(apps, using):
+        with transaction.atomic(using=using):
+            merged.append(merge_group(apps, using, group))
+    return merged
+
+
+def merge_duplicate_products(apps, schema_editor):
+    """RunPython function, for a migration that adds the constraint by hand."""
+    merge_duplicates(apps, schema_editor.connection.alias)
+
+
+def adds_stock_key_constraint(plan):
+    return any(
+        isinstance(operation, AddConstraint)
+        and migration.app_label == 'main'
+        and operation.model_name == 'product'
+        and operation.constraint.name == STOCK_KEY_CONSTRAINT
+        for migration, backwards in plan or ()
+        if not backwards
+        for operation in migration.operations
+    )
+
+
+def merge_before_stock_key_constraint(apps, plan, using, verbosity=1, stdout=None, **kwargs):
+    """
+    pre_migrate handler: the data migration of the product_unique_stock_key
+    constraint. Migrations are generated per installation, so it cannot be
+    a RunPython operation placed before the generated AddConstraint; it runs
+    on the historical models instead whenever the plan is about to add the
+    constraint to a products table that exists.
+    """
+    connection = connections[using]
+    Product = get_model(apps, 'main', 'Product')
+    if (
+        Product is None
+        or not adds_stock_key_constraint(plan)
+        or Product._meta.db_table not in connection.introspection.table_names()
+    ):
+        return
+
+    merged = merge_duplicates(apps, using)
+    if merged and verbosity:
+        count = sum(len(duplicates) for keep, duplicates in merged)
+        (stdout or sys.stdout).write(
+            f"Merged {count} duplicate products before adding {STOCK_KEY_CONSTRAINT}.\n"
+        )
@@ -0,0 +1,122 @@
+import tempfile
+
+from django.db.models import Max
+from django.db.models.functions import Length
+from django.http import FileResponse
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+CHUNK_SIZE = 2000
+
+TITLE = 'report_title'
+HEADER = 'report_header'
+LEFT = 'report_left'
+CENTER = 'report_center'
+
+
+def _named_styles():
+    thin = Side(style='thin')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    return (
+        NamedStyle(TITLE, font=Font(bold=True), alignment=Alignment(horizontal='left')),
+        NamedStyle(HEADER, font=Font(bold=True), alignment=Alignment(horizontal='center'),
+                   border=thin_border),
+        NamedStyle(LEFT, alignment=Alignment(horizontal='left'), border=thin_border),
+        NamedStyle(CENTER, alignment=Alignment(horizontal='center'), border=thin_border),
+    )
+
+
+def column_width(header, longest=0):
+    """Width fitting the header and the longest value (in characters) of a column."""
+    return max(len(header), longest or 0) + 2
+
+
+def widest_values(columns, number_fields, fixed_lengths=None):
+    """
+    Aggregates measuring the longest value of every column: the length of
+    text columns, the largest value of number columns. Columns listed in
+    ``fixed_lengths`` (e.g. formatted dates) are not measured.
+    """
+    fixed_lengths = fixed_lengths or {}
+    return {
+        f'widest_{field}': Max(field) if field in number_fields else Max(Length(field))
+        for _, field, _ in columns
+        if field not in fixed_lengths
+    }
+
+
+def column_widths(columns, number_fields, totals, fixed_lengths=None):
+    fixed_lengths = fixed_lengths or {}
+    widths = []
+    for header, field, _ in columns:
+        if field in fixed_lengths:
+            widths.append(column_width(header, fixed_lengths[field]))
+            continue
+
+        widest = totals[f'widest_{field}']
+        if field in number_fields and widest is not None:
+            widest = len(str(widest))
+        widths.append(column_width(header, widest))
+    return widths
+
+
+class StreamingSheet:
+    """
+    Single-sheet write-only workbook.
+
+    Rows are flushed to a temporary file as they are appended, so memory use
+    does not grow with the number of rows. Write-only sheets cannot be
+    restyled afterwards: column widths are fixed up front and every cell is
+    written with one of the named styles above.
+    """
+
+    def __init__(self, title, widths):
+        self.workbook = Workbook(write_only=True)
+        for style in _named_styles():
+            self.workbook.add_named_style(style)
+
+        self.sheet = self.workbook.create_sheet(title)
+        self.columns = len(widths)
+        for index, width in enumerate(widths, start=1):
+            self.sheet.column_dimensions[get_column_letter(index)].width = width
+
+        self.rows = 0
+
+    def _cell(self, value, style):
+        cell = WriteOnlyCell(self.sheet, value=value)
+        cell.style = style
+        return cell
+
+    def append(self, values, styles=None):
+        if styles is None:
+            self.sheet.append(values)
+        else:
+            self.sheet.append([self._cell(value, style) for value, style in zip(values, styles)])
+        self.rows += 1
+
+    def title(self, text):
+        """Bold line spanning all columns."""
+        self.append([text], [TITLE])
+        self.sheet.merged_cells.add(f"A{self.rows}:{get_column_letter(self.columns)}{self.rows}")
+
+    def header(self, headers):
+        self.append(headers, [HEADER] * len(headers))
+
+    def save(self, fileobj):
+        self.workbook.save(fileobj)
+
+    def response(self, filename):
+        """Stream the finished workbook from a temporary file."""
+        tmp = tempfile.TemporaryFile()
+        self.save(tmp)
+        tmp.seek(0)
+        return FileResponse(
+            tmp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE
+        )
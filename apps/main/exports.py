@@ -0,0 +1,159 @@
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.utils.timezone import now
+
+from .currency import converted
+from .excel import StreamingSheet, LEFT, CENTER, CHUNK_SIZE, widest_values, column_widths
+from .reorder import reorder_suggestions
+from .utils import format_currency
+
+
+STOCK_COLUMNS = (
+    ("Товар", 'name', LEFT),
+    ("Артикул", 'article_number', CENTER),
+    ("Склад", 'warehouse__name', LEFT),
+    ("Бренд", 'brand__name', LEFT),
+    ("Страна", 'country_of_origin__name', LEFT),
+    ("Количество", 'quantity', CENTER),
+    ("Себестоимость", 'cost_price', CENTER),
+    ("Цена продажи", 'selling_price', CENTER),
+)
+STOCK_NUMBER_FIELDS = ('quantity', 'cost_price', 'selling_price')
+
+
+def warehouse_stock_report(queryset, warehouse_text, progress=None):
+    """
+    Stock of the products in ``queryset`` that are in stock.
+
+    Totals and column widths come from a single aggregate query, rows are
+    streamed from a ``values_list`` iterator straight into the sheet.
+    ``progress(done, total)`` is called after every chunk of rows.
+    """
+    queryset = queryset.filter(quantity__gt=0)
+    headers = [header for header, _, _ in STOCK_COLUMNS]
+    fields = [field for _, field, _ in STOCK_COLUMNS]
+    styles = [style for _, _, style in STOCK_COLUMNS]
+
+    totals = queryset.aggregate(
+        total_positions=Count('pk'),
+        total_quantity=Sum('quantity', default=0),
+        total_cost=Sum(
+            ExpressionWrapper(
+                F('quantity') * F('cost_price'),
+                output_field=DecimalField(max_digits=15, decimal_places=2)
+            )
+        ),
+        total_cost_converted=converted(Sum(F('quantity') * F('cost_price'), default=0)),
+        **widest_values(STOCK_COLUMNS, STOCK_NUMBER_FIELDS),
+    )
+
+    sheet = StreamingSheet("Остатки склада", column_widths(STOCK_COLUMNS, STOCK_NUMBER_FIELDS, totals))
+
+    sheet.title(f"Склад: {warehouse_text}")
+    sheet.title(f"Дата формирования отчёта: {now().strftime('%Y-%m-%d %H:%M')}")
+    sheet.title(
+        f"Всего позиций: {totals['total_positions']} | Общее количество: {totals['total_quantity']}"
+    )
+    sheet.title(
+        f"Общая себестоимость: {totals['total_cost'] or 0:.2f} | "
+        f"{format_currency(totals['total_cost_converted'])}"
+    )
+
+    sheet.append([])
+    sheet.header(headers)
+
+    rows = queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    for index, (name, article_number, warehouse, brand, country, quantity, cost_price, selling_price) in (
+        enumerate(rows, start=1)
+    ):
+        sheet.append([
+            name,
+            article_number or '',
+            warehouse,
+            brand,
+            country,
+            quantity,
+            float(cost_price) if cost_price else '',
+            float(selling_price) if selling_price else '',
+        ], styles)
+
+        if progress and index % CHUNK_SIZE == 0:
+            progress(index, totals['total_positions'])
+
+    return sheet
+
+
+REORDER_COLUMNS = (
+    ("Товар", 'name', LEFT),
+    ("Артикул", 'article_number', CENTER),
+    ("Склад", 'warehouse__name', LEFT),
+    ("Бренд", 'brand__name', LEFT),
+    ("Остаток", 'quantity', CENTER),
+    ("Продано (кор. период)", 'sold_short', CENTER),
+    ("Продано (длин. период)", 'sold_long', CENTER),
+    ("Продаж в день", 'daily_sales', CENTER),
+    ("Дней запаса", 'days_of_cover', CENTER),
+    ("Заказать", 'suggested_quantity', CENTER),
+    ("Себестоимость", 'cost_price', CENTER),
+)
+REORDER_NUMBER_FIELDS = ('quantity', 'cost_price')
+# Computed columns are not measured, they get room for a few digits.
+REORDER_FIXED_LENGTHS = {'sold_short': 6, 'sold_long': 6, 'daily_sales': 6, 'days_of_cover': 6,
+                         'suggested_quantity': 6}
+
+
+def reorder_report(queryset, warehouse_text, params, progress=None):
+    """
+    Reorder suggestions for ``queryset`` (see ``apps.main.reorder``) with
+    the reorder ``params`` of ReorderForm, streamed like the stock report.
+    """
+    queryset = reorder_suggestions(queryset, **params)
+    headers = [header for header, _, _ in REORDER_COLUMNS]
+    fields = [field for _, field, _ in REORDER_COLUMNS]
+    styles = [style for _, _, style in REORDER_COLUMNS]
+
+    totals = queryset.order_by().aggregate(
+        total_positions=Count('pk'),
+        total_quantity=Sum('suggested_quantity', default=0),
+        total_cost_converted=converted(Sum(F('suggested_quantity') * F('cost_price'), default=0)),
+        **widest_values(REORDER_COLUMNS, REORDER_NUMBER_FIELDS, REORDER_FIXED_LENGTHS),
+    )
+
+    sheet = StreamingSheet(
+        "Заказ", column_widths(REORDER_COLUMNS, REORDER_NUMBER_FIELDS, totals, REORDER_FIXED_LENGTHS)
+    )
+
+    sheet.title(f"Склад: {warehouse_text}")
+    sheet.title(f"Дата формирования отчёта: {now().strftime('%Y-%m-%d %H:%M')}")
+    sheet.title(
+        f"Периоды продаж: {params['short_window']} и {params['long_window']} дн. | "
+        f"Срок поставки: {params['lead_time']} дн. | Запас после поставки: {params['cover_days']} дн."
+    )
+    sheet.title(
+        f"Позиций к заказу: {totals['total_positions']} | Количество: {totals['total_quantity']} | "
+        f"По себестоимости: {format_currency(totals['total_cost_converted'])}"
+    )
+
+    sheet.append([])
+    sheet.header(headers)
+
+    rows = queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    for index, (name, article_number, warehouse, brand, quantity, sold_short, sold_long, daily_sales,
+                days_of_cover, suggested_quantity, cost_price) in enumerate(rows, start=1):
+        sheet.append([
+            name,
+            article_number or '',
+            warehouse,
+            brand,
+            quantity,
+            sold_short,
+            sold_long,
+            round(daily_sales, 2),
+            round(days_of_cover, 1),
+            suggested_quantity,
+            float(cost_price) if cost_price else '',
+        ], styles)
+
+        if progress and index % CHUNK_SIZE == 0:
+            progress(index, totals['total_positions'])
+
+    return sheet
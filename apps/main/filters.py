@@ -1,4 +1,24 @@
+from datetime import timedelta
+
 from django.contrib.admin import SimpleListFilter
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import ProductCompatibility
+
+
+def sale_period_start(period):
+    """First day (local date) of a SalePeriodFilter period, None for all time."""
+    today = timezone.localdate()
+    if period == 'today':
+        return today
+    if period == 'week':
+        return today - timedelta(days=today.weekday())
+    if period == 'month':
+        return today.replace(day=1)
+    if period == 'year':
+        return today.replace(month=1, day=1)
+    return None
 
 
 class SoldQuantityFilter(SimpleListFilter):
@@ -41,3 +61,25 @@ class SalePeriodFilter(SimpleListFilter):
 
     def queryset(self, request, queryset):
         return queryset 
+
+
+class VehicleFilter(SimpleListFilter):
+    title = "Подходит для"
+    parameter_name = "vehicle"
+    limit = 50
+
+    def lookups(self, request, model_admin):
+        # The most common vehicle models, counted on the compatibility index.
+        vehicles = (
+            ProductCompatibility.objects.values('vehicle')
+            .annotate(products=Count('product'))
+            .order_by('-products', 'vehicle')[:self.limit]
+        )
+        return [(row['vehicle'], f"{row['vehicle']} ({row['products']})") for row in vehicles]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                pk__in=ProductCompatibility.objects.filter(vehicle=self.value()).values('product_id')
+            )
+        return queryset
@@ -0,0 +1,27 @@
+from django import forms
+
+from .models import Warehouse
+from .reorder import COVER_DAYS, LEAD_TIME, LONG_WINDOW, SHORT_WINDOW
+
+
+class StockAsOfForm(forms.Form):
+    date = forms.DateField(label="На дату", widget=forms.DateInput(attrs={'type': 'date'}))
+    warehouse = forms.ModelChoiceField(Warehouse.objects.all(), label="Склад", required=False,
+                                       empty_label="Все склады")
+
+
+class ReorderForm(forms.Form):
+    warehouse = forms.ModelChoiceField(Warehouse.objects.all(), label="Склад", required=False,
+                                       empty_label="Все склады")
+    short_window = forms.IntegerField(label="Короткий период, дней", min_value=1, max_value=365,
+                                      initial=SHORT_WINDOW)
+    long_window = forms.IntegerField(label="Длинный период, дней", min_value=1, max_value=730,
+                                     initial=LONG_WINDOW)
+    lead_time = forms.IntegerField(label="Срок поставки, дней", min_value=0, max_value=365, initial=LEAD_TIME)
+    cover_days = forms.IntegerField(label="Запас после поставки, дней", min_value=0, max_value=365,
+                                    initial=COVER_DAYS)
+
+    def reorder_params(self):
+        return {
+            field: self.cleaned_data[field] for field in ('short_window', 'long_window', 'lead_time', 'cover_days')
+        }
@@ -0,0 +1,142 @@
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+
+PROFILES = {
+    'default': {},
+    'production': settings.SQLITE_OPTIONS,
+}
+
+PRODUCTS = 1000
+
+
+def use_database(alias, path, options):
+    """Register a scratch SQLite database under ``alias``, with its own connection per thread."""
+    connections.settings[alias] = dict(
+        connections[DEFAULT_DB_ALIAS].settings_dict,
+        ENGINE='django.db.backends.sqlite3', NAME=str(path), OPTIONS=options,
+    )
+
+
+def create_schema(alias, rows):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('CREATE TABLE bench_product (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL)')
+        cursor.execute(
+            'CREATE TABLE bench_sale (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, '
+            'quantity INTEGER NOT NULL, price REAL NOT NULL, created REAL NOT NULL)'
+        )
+        cursor.execute('CREATE INDEX bench_sale_product ON bench_sale (product_id)')
+        cursor.executemany(
+            'INSERT INTO bench_product (id, quantity) VALUES (%s, %s)',
+            [(pk, 10 ** 9) for pk in range(1, PRODUCTS + 1)],
+        )
+        cursor.executemany(
+            'INSERT INTO bench_sale (product_id, quantity, price, created) VALUES (%s, %s, %s, %s)',
+            [(random.randint(1, PRODUCTS), random.randint(1, 3), 10.0, time.time()) for _ in range(rows)],
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure SQLite write throughput and lock waits under concurrent load, with "
+        "the plain SQLite defaults and with the production profile of settings.SQLITE_OPTIONS. "
+        "Writers save sales (read the stock, update it, add a line) while readers run "
+        "export-like scans. Works on scratch databases in a temporary directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Threads saving sales.")
+        parser.add_argument('--readers', type=int, default=2, help="Threads running long reads.")
+        parser.add_argument('--seconds', type=float, default=10, help="Duration of each run.")
+        parser.add_argument('--rows', type=int, default=200000, help="Sale lines in the scratch database.")
+        parser.add_argument('--profile', choices=PROFILES, action='append',
+                            help="Profile to run (repeatable); all by default.")
+
+    def handle(self, *args, writers, readers, seconds, rows, profile, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in profile or PROFILES:
+                alias = f'benchmark_{name}'
+                use_database(alias, Path(directory) / f'{name}.sqlite3', PROFILES[name])
+                try:
+                    create_schema(alias, rows)
+                    connections[alias].close()
+                    self.report(name, self.run(alias, writers, readers, seconds), seconds)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+    def run(self, alias, writers, readers, seconds):
+        results = {'latencies': [], 'locked': 0, 'reads': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def save_sale():
+            product_id = random.randint(1, PRODUCTS)
+            with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                cursor.execute('SELECT quantity FROM bench_product WHERE id = %s', [product_id])
+                cursor.fetchone()
+                cursor.execute('UPDATE bench_product SET quantity = quantity - 1 WHERE id = %s', [product_id])
+                cursor.execute(
+                    'INSERT INTO bench_sale (product_id, quantity, price, created) VALUES (%s, 1, 10.0, %s)',
+                    [product_id, time.time()],
+                )
+
+        def export():
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT product_id, SUM(quantity * price) FROM bench_sale GROUP BY product_id')
+                cursor.fetchall()
+
+        def writer():
+            try:
+                while time.monotonic() < deadline:
+                    started = time.monotonic()
+                    try:
+                        save_sale()
+                    except OperationalError as error:
+                        if 'locked' not in str(error):
+                            raise
+                        with lock:
+                            results['locked'] += 1
+                        continue
+                    with lock:
+                        results['latencies'].append(time.monotonic() - started)
+            finally:
+                connections[alias].close()
+
+        def reader():
+            try:
+                while time.monotonic() < deadline:
+                    export()
+                    with lock:
+                        results['reads'] += 1
+            finally:
+                connections[alias].close()
+
+        with ThreadPoolExecutor(max_workers=writers + readers) as pool:
+            futures = [pool.submit(writer) for _ in range(writers)]
+            futures += [pool.submit(reader) for _ in range(readers)]
+            for future in futures:
+                future.result()
+        return results
+
+    def report(self, name, results, seconds):
+        latencies = sorted(latency * 1000 for latency in results['latencies'])
+        committed = len(latencies)
+        if len(latencies) >= 2:
+            p50, p95 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 94))
+        else:
+            p50 = p95 = latencies[0] if latencies else 0
+        self.stdout.write(
+            f"{name:>10}: {committed} sales ({committed / seconds:.0f}/s), "
+            f"{results['locked']} failed with \"database is locked\", {results['reads']} exports; "
+            f"sale latency p50 {p50:.1f} ms, p95 {p95:.1f} ms, max {latencies[-1] if latencies else 0:.1f} ms"
+        )
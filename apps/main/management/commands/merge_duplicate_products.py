@@ -0,0 +1,43 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from apps.main.dedup import duplicate_groups, merge_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge Products sharing a stock key (warehouse, country, name, brand, article number) "
+        "into the oldest one. migrate does this by itself before adding the "
+        "product_unique_stock_key constraint; the command is for checking and merging by hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the duplicates, change nothing.")
+
+    def handle(self, *args, dry_run, **options):
+        groups = list(duplicate_groups(apps, DEFAULT_DB_ALIAS))
+        if not groups:
+            self.stdout.write(self.style.SUCCESS("No duplicate products."))
+            return
+
+        merged = 0
+        for group in groups:
+            if dry_run:
+                self.stdout.write(
+                    f"{group['rows']} products «{group['name']}» ({group['stock_article'] or '—'}) "
+                    f"would be merged into #{group['keep_pk']}"
+                )
+                continue
+
+            with transaction.atomic():
+                keep, duplicates = merge_group(apps, DEFAULT_DB_ALIAS, group)
+            merged += len(duplicates)
+            self.stdout.write(
+                f"Merged {', '.join(f'#{product.pk}' for product in duplicates)} into #{keep.pk} "
+                f"({keep.name}, {keep.quantity} шт.)"
+            )
+
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Merged {merged} duplicate products."))
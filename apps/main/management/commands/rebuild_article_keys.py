@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.excel import CHUNK_SIZE
+from apps.main.models import ArrivalProduct, Product
+from apps.main.utils import normalize_article
+
+
+class Command(BaseCommand):
+    help = "Recompute the normalized article_key of every Product and ArrivalProduct."
+
+    def handle(self, *args, **options):
+        for model in (Product, ArrivalProduct):
+            updated = 0
+            batch = []
+            for row in model.objects.only('article_number', 'article_key').iterator(CHUNK_SIZE):
+                key = normalize_article(row.article_number)
+                if row.article_key != key:
+                    row.article_key = key
+                    batch.append(row)
+                if len(batch) == CHUNK_SIZE:
+                    updated += model.objects.bulk_update(batch, ['article_key'])
+                    batch = []
+            updated += model.objects.bulk_update(batch, ['article_key'])
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Updated the article key of {updated} {model.__name__} rows."
+            ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.main.compatibility import compatibility_rows
+from apps.main.excel import CHUNK_SIZE
+from apps.main.models import Product, ProductCompatibility
+
+
+class Command(BaseCommand):
+    help = "Rebuild the vehicle compatibility index of every Product from its suits_for text."
+
+    def handle(self, *args, **options):
+        created = 0
+
+        with transaction.atomic():
+            ProductCompatibility.objects.all().delete()
+
+            batch = []
+            for product in Product.objects.exclude(suits_for=None).exclude(suits_for='').only(
+                'suits_for'
+            ).iterator(CHUNK_SIZE):
+                batch.append(product)
+                if len(batch) == CHUNK_SIZE:
+                    created += len(ProductCompatibility.objects.bulk_create(compatibility_rows(batch)))
+                    batch = []
+            created += len(ProductCompatibility.objects.bulk_create(compatibility_rows(batch)))
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {created} product/vehicle pairs."))
@@ -0,0 +1,90 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.main.excel import CHUNK_SIZE
+from apps.main.models import Product, StockMovement
+from apps.main.stock import average_cost
+from apps.sales.models import SaleItem
+
+
+def replay_costs(current_costs):
+    """
+    Replay the StockMovement ledger product by product, in order, through
+    ``average_cost``. Arrivals come in at the cost of their line, sales go
+    out at the running average, which becomes the cost of the sale line,
+    and returns come back at that cost. Adjustments and movements whose
+    line is gone move no value.
+
+    Returns the final average per product and the cost of every sale line
+    per ``(sale_item_id, product_id)``.
+    """
+    movements = StockMovement.objects.order_by('product', 'created_at', 'pk').values_list(
+        'product', 'quantity', 'kind', 'arrival_item__cost_price', 'sale_item',
+    )
+
+    product_costs, line_costs = {}, {}
+    for product_id, rows in groupby(movements.iterator(CHUNK_SIZE), key=itemgetter(0)):
+        quantity, cost = 0, None
+        for _, delta, kind, arrival_cost, sale_item_id in rows:
+            line = (sale_item_id, product_id)
+            if kind == 'sale' and sale_item_id and delta < 0:
+                unit_cost = line_costs.setdefault(line, cost)
+            elif kind == 'sale' and sale_item_id:
+                unit_cost = line_costs.get(line, cost)
+            elif kind == 'arrival' and arrival_cost is not None:
+                unit_cost = arrival_cost
+            else:
+                unit_cost = cost if cost is not None else current_costs.get(product_id)
+
+            if unit_cost is not None:
+                cost = average_cost(quantity, cost, delta, delta * unit_cost, unit_cost)
+            quantity += delta
+
+        product_costs[product_id] = cost
+
+    return product_costs, line_costs
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the weighted-average cost of every Product and the cost of goods "
+        "sold of every sale line by replaying the StockMovement ledger, then rebuild "
+        "the sales rollups. Run after importing history or correcting old arrivals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many costs would change.")
+
+    def handle(self, *args, dry_run, **options):
+        current_costs = dict(Product.objects.values_list('pk', 'cost_price'))
+        product_costs, line_costs = replay_costs(current_costs)
+
+        now = timezone.now()
+        products = [
+            Product(pk=pk, cost_price=cost, updated_at=now)
+            for pk, cost in product_costs.items()
+            if cost is not None and cost != current_costs.get(pk)
+        ]
+        lines = []
+        for pk, product_id, cost_price in SaleItem.objects.values_list('pk', 'product', 'cost_price').iterator(CHUNK_SIZE):
+            cost = line_costs.get((pk, product_id))
+            if cost is not None and cost != cost_price:
+                lines.append(SaleItem(pk=pk, cost_price=cost))
+
+        self.stdout.write(f"{len(products)} product costs and {len(lines)} sale line costs differ from the ledger.")
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ['cost_price', 'updated_at'], batch_size=CHUNK_SIZE)
+            SaleItem.objects.bulk_update(lines, ['cost_price'], batch_size=CHUNK_SIZE)
+
+        if lines:
+            call_command('rebuild_sales_rollup', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Average costs recomputed."))
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.main.reports import claim_next_job, fail_stale_jobs, run_report_job
+
+
+def run_in_thread(job):
+    try:
+        run_report_job(job)
+    finally:
+        # Every pool thread owns its own database connection.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Build queued background reports (ReportJob) with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.REPORT_JOB_WORKERS,
+                            help="Number of reports built at the same time.")
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help="Seconds to wait before looking for new jobs when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit as soon as the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=settings.REPORT_JOB_TIMEOUT,
+                            help="Fail running jobs without progress for this many seconds.")
+
+    def handle(self, *args, workers, poll, once, stale_after, **options):
+        self.stdout.write(f"Report worker started with {workers} threads.")
+        self.fail_stale_jobs(stale_after)
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+
+                job = claim_next_job() if len(running) < workers else None
+                if job is not None:
+                    self.stdout.write(f"Building {job}")
+                    running.add(pool.submit(run_in_thread, job))
+                    continue
+
+                if once and not running:
+                    break
+
+                close_old_connections()
+                self.fail_stale_jobs(stale_after)
+                time.sleep(poll)
+
+    def fail_stale_jobs(self, stale_after):
+        failed = fail_stale_jobs(stale_after)
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Failed {failed} abandoned running jobs."))
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.main.excel import CHUNK_SIZE
+from apps.main.models import Product, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the current stock of every product as a StockSnapshot. Run it "
+        "periodically (e.g. nightly from cron) so that historical stock only has to "
+        "replay the movements since the last snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=None,
+                            help="Also delete snapshots older than this many days.")
+
+    def handle(self, *args, keep_days, **options):
+        taken_at = timezone.now()
+        created = 0
+
+        # Sales dated later than now are already off the quantity but belong
+        # to the snapshots after their date.
+        later = StockMovement.objects.filter(product=OuterRef('pk'), created_at__gt=taken_at).order_by().values(
+            'product'
+        ).annotate(total=Sum('quantity')).values('total')
+        stock = Product.objects.annotate(
+            stock=F('quantity') - Coalesce(Subquery(later), 0, output_field=IntegerField()),
+        ).values_list('pk', 'stock')
+
+        with transaction.atomic():
+            batch = []
+            for product_id, quantity in stock.iterator(CHUNK_SIZE):
+                batch.append(StockSnapshot(product_id=product_id, quantity=quantity, taken_at=taken_at))
+                if len(batch) == CHUNK_SIZE:
+                    created += len(StockSnapshot.objects.bulk_create(batch))
+                    batch = []
+            created += len(StockSnapshot.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(f"Saved {created} stock snapshots at {taken_at:%Y-%m-%d %H:%M}."))
+
+        if keep_days is not None:
+            deleted, _ = StockSnapshot.objects.filter(
+                taken_at__lt=taken_at - timedelta(days=keep_days)
+            ).delete()
+            self.stdout.write(f"Deleted {deleted} old snapshots.")
@@ -0,0 +1,68 @@
+from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+
+class ConvertedQuerySet(models.QuerySet):
+    def with_converted(self, **amounts):
+        """
+        Annotate USD amounts converted to the selected currency, e.g.
+        ``Product.objects.with_converted(converted_cost_price='cost_price')``.
+        """
+        from .currency import converted
+
+        return self.annotate(**{
+            name: converted(amount) for name, amount in amounts.items()
+        })
+
+
+class ProductQuerySet(ConvertedQuerySet):
+    def as_of(self, moment):
+        """
+        Annotate ``stock_as_of``, the quantity in stock at ``moment``.
+
+        Starts from the latest StockSnapshot taken at or before ``moment``
+        and adds the movements between the two, so only the movements since
+        the last snapshot are scanned. Without an earlier snapshot the
+        movements after ``moment`` are taken back off the current quantity.
+        """
+        from .models import StockMovement, StockSnapshot
+
+        def moved(**lookups):
+            return Coalesce(
+                Subquery(
+                    StockMovement.objects.filter(product=OuterRef('pk'), **lookups)
+                    .order_by()
+                    .values('product')
+                    .annotate(total=Sum('quantity'))
+                    .values('total')
+                ),
+                0,
+                output_field=IntegerField(),
+            )
+
+        snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'), taken_at__lte=moment).order_by('-taken_at')
+
+        return self.annotate(
+            snapshot_at=Subquery(snapshots.values('taken_at')[:1]),
+            snapshot_quantity=Subquery(snapshots.values('quantity')[:1]),
+        ).annotate(
+            stock_as_of=Case(
+                When(snapshot_at__isnull=True, then=ExpressionWrapper(
+                    F('quantity') - moved(created_at__gt=moment), output_field=IntegerField()
+                )),
+                default=ExpressionWrapper(
+                    F('snapshot_quantity') + moved(created_at__gt=OuterRef('snapshot_at'), created_at__lte=moment),
+                    output_field=IntegerField(),
+                ),
+                output_field=IntegerField(),
+            ),
+        )
+
+
+class WarehouseQuerySet(models.QuerySet):
+    def with_stock_totals(self):
+        return self.annotate(
+            products_type_count=Count('products'),
+            products_quantity_sum=Sum('products__quantity', default=0),
+        )
@@ -0,0 +1,13 @@
+from .currency import activate_currency_context, deactivate_currency_context
+
+
+class CurrencyContextMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = activate_currency_context()
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate_currency_context(token)
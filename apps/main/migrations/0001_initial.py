@@ -0,0 +1,187 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Brand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название марки')),
+                ('logo', models.ImageField(blank=True, null=True, upload_to='brand_logos/', verbose_name='Логотип марки')),
+            ],
+            options={
+                'verbose_name': 'Марка',
+                'verbose_name_plural': 'Марки',
+            },
+        ),
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название страны')),
+                ('flag_image', models.ImageField(blank=True, null=True, upload_to='country_flags/', verbose_name='Флаг страны')),
+            ],
+            options={
+                'verbose_name': 'Страна',
+                'verbose_name_plural': 'Страны',
+            },
+        ),
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_code', models.CharField(max_length=3, unique=True, verbose_name='Код валюты')),
+                ('rate_to_usd', models.DecimalField(decimal_places=4, max_digits=10, verbose_name='Сколько стоит 1 USD в этой валюте')),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('selected', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'Курс валюты',
+                'verbose_name_plural': 'Курсы валют',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Количество')),
+                ('taken_at', models.DateTimeField(verbose_name='Время снимка')),
+            ],
+            options={
+                'verbose_name': 'Снимок остатков',
+                'verbose_name_plural': 'Снимки остатков',
+            },
+        ),
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название склада')),
+            ],
+            options={
+                'verbose_name': 'Склад',
+                'verbose_name_plural': 'Склады',
+            },
+        ),
+        migrations.CreateModel(
+            name='Arrival',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Общая сумма')),
+                ('date', models.DateField(verbose_name='Дата поступления')),
+                ('comment', models.CharField(blank=True, max_length=500, null=True, verbose_name='Комментарий')),
+                ('country_of_origin', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='arrival_products', to='main.country', verbose_name='Страна происхождения')),
+            ],
+            options={
+                'verbose_name': 'Поступление',
+                'verbose_name_plural': 'Поступления',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('article_number', models.CharField(blank=True, max_length=50, null=True, verbose_name='Артикул')),
+                ('article_key', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=50, verbose_name='Ключ артикула')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('cost_price', models.DecimalField(blank=True, decimal_places=2, help_text='Средневзвешенная себестоимость остатка', max_digits=10, null=True, verbose_name='Себестоимость')),
+                ('selling_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Цена продажи')),
+                ('suits_for', models.CharField(blank=True, help_text='Укажите модели автомобилей, для которых подходит эта запчасть', max_length=200, null=True, verbose_name='Подходит для')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменён')),
+                ('abc_class', models.CharField(blank=True, choices=[('A', 'A — основная выручка'), ('B', 'B — средняя выручка'), ('C', 'C — малая выручка')], db_index=True, default='', editable=False, max_length=1, verbose_name='ABC')),
+                ('value_class', models.CharField(blank=True, choices=[('A', 'A — основная стоимость запаса'), ('B', 'B — средняя стоимость запаса'), ('C', 'C — малая стоимость запаса')], db_index=True, default='', editable=False, max_length=1, verbose_name='ABC по запасу')),
+                ('xyz_class', models.CharField(blank=True, choices=[('X', 'X — стабильный спрос'), ('Y', 'Y — колеблющийся спрос'), ('Z', 'Z — нерегулярный спрос')], db_index=True, default='', editable=False, max_length=1, verbose_name='XYZ')),
+                ('stock_class', models.CharField(blank=True, choices=[('active', 'Продаётся'), ('slow', 'Продаётся медленно'), ('dead', 'Неликвид')], db_index=True, default='', editable=False, max_length=6, verbose_name='Оборачиваемость')),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='products', to='main.brand', verbose_name='Бренд')),
+                ('country_of_origin', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='products', to='main.country', verbose_name='Страна происхождения')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArrivalProduct',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('article_number', models.CharField(blank=True, max_length=50, null=True, verbose_name='Артикул')),
+                ('article_key', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=50, verbose_name='Ключ артикула')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('cost_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Себестоимость')),
+                ('suits_for', models.CharField(blank=True, help_text='Укажите модели автомобилей, для которых подходит эта запчасть', max_length=200, null=True, verbose_name='Подходит для')),
+                ('arrival', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='items', to='main.arrival', verbose_name='Поступление')),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='arrival_products', to='main.brand', verbose_name='Бренд')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='main.product', verbose_name='Выбрать товар')),
+            ],
+            options={
+                'verbose_name': 'Товар поступления',
+                'verbose_name_plural': 'Товары поступлений',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductCompatibility',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle', models.CharField(db_index=True, max_length=100, verbose_name='Модель автомобиля')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibilities', to='main.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Совместимость',
+                'verbose_name_plural': 'Совместимость',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='Отчёт')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готов'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('result', models.FileField(blank=True, null=True, upload_to='reports/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начат')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Фоновый отчёт',
+                'verbose_name_plural': 'Фоновые отчёты',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Изменение')),
+                ('kind', models.CharField(choices=[('arrival', 'Поступление'), ('sale', 'Продажа'), ('adjustment', 'Корректировка')], max_length=10, verbose_name='Тип')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+                ('arrival_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='main.arrivalproduct', verbose_name='Товар поступления')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='main.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Движение товара',
+                'verbose_name_plural': 'Движения товаров',
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('main', '0001_initial'),
+        ('sales', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='sale_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='sales.saleitem', verbose_name='Товар продажи'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='main.product', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='products', to='main.warehouse', verbose_name='Склад'),
+        ),
+        migrations.AddField(
+            model_name='arrival',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='arrivals', to='main.warehouse', verbose_name='Склад'),
+        ),
+        migrations.AddConstraint(
+            model_name='productcompatibility',
+            constraint=models.UniqueConstraint(fields=('product', 'vehicle'), name='product_compatibility_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['product', 'taken_at'], name='stock_snapshot_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['warehouse', 'country_of_origin', 'name', 'brand', 'article_number'], name='product_stock_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(models.F('warehouse'), models.F('country_of_origin'), models.F('name'), models.F('brand'), django.db.models.functions.comparison.Coalesce('article_number', models.Value('')), name='product_unique_stock_key', violation_error_message='Такой товар уже есть на этом складе'),
+        ),
+    ]
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .managers import ConvertedQuerySet, ProductQuerySet, WarehouseQuerySet
 
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название склада')
 
+    objects = WarehouseQuerySet.as_manager()
+
     @property
     def total_products_type(self):
+        if hasattr(self, 'products_type_count'):
+            return self.products_type_count
         return self.products.count()
     
     @property
     def total_quantity_of_goods(self):
-        return sum(product.quantity for product in self.products.all())
+        if hasattr(self, 'products_quantity_sum'):
+            return self.products_quantity_sum
+        return self.products.aggregate(total=models.Sum('quantity', default=0))['total']
 
     def __str__(self):
         return self.name
@@ -45,12 +57,36 @@ class Brand(models.Model):
 
 
 class Product(models.Model):
+    ABC_CLASSES = (
+        ('A', 'A — основная выручка'),
+        ('B', 'B — средняя выручка'),
+        ('C', 'C — малая выручка'),
+    )
+    VALUE_CLASSES = (
+        ('A', 'A — основная стоимость запаса'),
+        ('B', 'B — средняя стоимость запаса'),
+        ('C', 'C — малая стоимость запаса'),
+    )
+    XYZ_CLASSES = (
+        ('X', 'X — стабильный спрос'),
+        ('Y', 'Y — колеблющийся спрос'),
+        ('Z', 'Z — нерегулярный спрос'),
+    )
+    STOCK_CLASSES = (
+        ('active', 'Продаётся'),
+        ('slow', 'Продаётся медленно'),
+        ('dead', 'Неликвид'),
+    )
+
     name = models.CharField(max_length=100, verbose_name="Название")
     article_number = models.CharField(max_length=50, verbose_name="Артикул", null=True, blank=True)
+    article_key = models.CharField(max_length=50, blank=True, default='', editable=False, db_index=True,
+                                   verbose_name="Ключ артикула")
     warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, related_name='products', verbose_name="Склад")
     quantity = models.PositiveIntegerField(verbose_name="Количество")
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Себестоимость", 
-                                     null=True, blank=True)
+                                     null=True, blank=True,
+                                     help_text="Средневзвешенная себестоимость остатка")
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена продажи", 
                                         null=True, blank=True)
     brand = models.ForeignKey(Brand, on_delete=models.PROTECT, related_name='products', verbose_name="Бренд")
@@ -58,17 +94,103 @@ class Product(models.Model):
                                           verbose_name="Страна происхождения")
     suits_for = models.CharField(max_length=200, verbose_name="Подходит для", null=True, blank=True,
                                  help_text="Укажите модели автомобилей, для которых подходит эта запчасть")
+    # Also set by the bulk arrival path when it changes the cost price.
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменён")
+    # Set by the classify_products command (see apps.main.classification).
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES, blank=True, default='', editable=False,
+                                 db_index=True, verbose_name="ABC")
+    value_class = models.CharField(max_length=1, choices=VALUE_CLASSES, blank=True, default='', editable=False,
+                                   db_index=True, verbose_name="ABC по запасу")
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CLASSES, blank=True, default='', editable=False,
+                                 db_index=True, verbose_name="XYZ")
+    stock_class = models.CharField(max_length=6, choices=STOCK_CLASSES, blank=True, default='', editable=False,
+                                   db_index=True, verbose_name="Оборачиваемость")
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
-        return f"{self.name} арт: ({self.article_number}) ({self.quantity} шт) В {self.warehouse.name}, Себсть: {self.cost_price}"
+        return self.label(self.name, self.article_number, self.quantity, self.warehouse.name, self.cost_price)
+
+    @staticmethod
+    def label(name, article_number, quantity, warehouse_name, cost_price):
+        return f"{name} арт: ({article_number}) ({quantity} шт) В {warehouse_name}, Себсть: {cost_price}"
     
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         # ordering = ('name',)
+        # Stock key used by arrivals to find the Product of a line
+        # (see apps.main.stock). A missing article number counts as ''.
+        indexes = [
+            models.Index(
+                fields=['warehouse', 'country_of_origin', 'name', 'brand', 'article_number'],
+                name='product_stock_key_idx',
+            ),
+            # Keyset pagination of the product changelist (see apps.main.pagination).
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                F('warehouse'), F('country_of_origin'), F('name'), F('brand'),
+                Coalesce('article_number', Value('')),
+                name='product_unique_stock_key',
+                violation_error_message="Такой товар уже есть на этом складе",
+            ),
+        ]
+
+
+class ProductCompatibility(models.Model):
+    """One vehicle model parsed from Product.suits_for, indexed for lookups."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='compatibilities',
+                                verbose_name="Товар")
+    vehicle = models.CharField(max_length=100, db_index=True, verbose_name="Модель автомобиля")
+
+    def __str__(self):
+        return self.vehicle
+
+    class Meta:
+        verbose_name = "Совместимость"
+        verbose_name_plural = "Совместимость"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'vehicle'], name='product_compatibility_unique'),
+        ]
+
+
+class StoredFieldsModel(models.Model):
+    """
+    Model with ``stored_fields`` maintained elsewhere with F() updates, so
+    the values held by an instance may be stale: ``save()`` never writes
+    them back on update.
+    """
+    stored_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.stored_fields
+            ]
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
 
 
-class Arrival(models.Model):
+class StoredTotalModel(StoredFieldsModel):
+    """
+    Document whose ``total_amount`` is maintained by the save/delete signals
+    of its items (see ``rebuild_totals`` to recompute it from scratch).
+    """
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, editable=False,
+                                       verbose_name="Общая сумма")
+
+    stored_fields = ('total_amount',)
+
+    class Meta:
+        abstract = True
+
+
+class Arrival(StoredTotalModel):
     warehouse = models.ForeignKey(
         Warehouse, on_delete=models.PROTECT, related_name='arrivals', verbose_name='Склад'
     )
@@ -77,13 +199,11 @@ class Arrival(models.Model):
                                           verbose_name="Страна происхождения")
     comment = models.CharField(max_length=500, verbose_name="Комментарий", null=True, blank=True)
 
+    objects = ConvertedQuerySet.as_manager()
+
     def __str__(self):
         return f"Поступление #{self.date} → {self.warehouse.name}"
     
-    @property
-    def total_amount(self):
-        return sum(item.quantity * item.cost_price for item in self.items.all())
-    
     class Meta:
         verbose_name = "Поступление"
         verbose_name_plural = "Поступления"
@@ -103,6 +223,8 @@ class ArrivalProduct(models.Model):
     )
     name = models.CharField(max_length=100, verbose_name="Название")
     article_number = models.CharField(max_length=50, verbose_name="Артикул", null=True, blank=True)
+    article_key = models.CharField(max_length=50, blank=True, default='', editable=False, db_index=True,
+                                   verbose_name="Ключ артикула")
     quantity = models.PositiveIntegerField(verbose_name="Количество")
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Себестоимость",)
     # selling_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена продажи", 
@@ -110,6 +232,8 @@ class ArrivalProduct(models.Model):
     brand = models.ForeignKey(Brand, on_delete=models.PROTECT, related_name='arrival_products', verbose_name="Бренд")
     suits_for = models.CharField(max_length=200, verbose_name="Подходит для", null=True, blank=True,
                                  help_text="Укажите модели автомобилей, для которых подходит эта запчасть")
+
+    objects = ConvertedQuerySet.as_manager()
     
     @property 
     def total_cost(self):
@@ -149,3 +273,84 @@ class CurrencyRate(models.Model):
     class Meta:
         verbose_name = "Курс валюты"
         verbose_name_plural = "Курсы валют"
+
+
+class ReportJob(models.Model):
+    STATUSES = (
+        ('pending', 'В очереди'),
+        ('running', 'Формируется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    )
+
+    kind = models.CharField(max_length=50, verbose_name="Отчёт")
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending', db_index=True,
+                              verbose_name="Статус")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Прогресс, %")
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    result = models.FileField(upload_to='reports/', null=True, blank=True, verbose_name="Файл")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='report_jobs', verbose_name="Автор")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начат")
+    # Touched by the worker on every progress update (see fail_stale_jobs).
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершён")
+
+    def __str__(self):
+        return f"Отчёт #{self.pk} ({self.kind})"
+
+    class Meta:
+        verbose_name = "Фоновый отчёт"
+        verbose_name_plural = "Фоновые отчёты"
+        ordering = ['-created_at']
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of stock changes: every change of Product.quantity
+    is recorded here with its signed quantity.
+    """
+    KINDS = (
+        ('arrival', 'Поступление'),
+        ('sale', 'Продажа'),
+        ('adjustment', 'Корректировка'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements', verbose_name="Товар")
+    quantity = models.IntegerField(verbose_name="Изменение")
+    kind = models.CharField(max_length=10, choices=KINDS, verbose_name="Тип")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Время")
+    arrival_item = models.ForeignKey(ArrivalProduct, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='movements', verbose_name="Товар поступления")
+    sale_item = models.ForeignKey('sales.SaleItem', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='movements', verbose_name="Товар продажи")
+
+    def __str__(self):
+        return f"{self.product.name}: {self.quantity:+d} ({self.get_kind_display()})"
+
+    class Meta:
+        verbose_name = "Движение товара"
+        verbose_name_plural = "Движения товаров"
+        indexes = [models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx')]
+
+
+class StockSnapshot(models.Model):
+    """
+    Stock at ``taken_at``, the starting point for historical stock: the sum
+    of the movements dated up to it. Movements are dated by their document,
+    so an arrival or sale entered late can take it below zero.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Товар")
+    quantity = models.IntegerField(verbose_name="Количество")
+    taken_at = models.DateTimeField(verbose_name="Время снимка")
+
+    def __str__(self):
+        return f"{self.product.name}: {self.quantity} на {self.taken_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        verbose_name = "Снимок остатков"
+        verbose_name_plural = "Снимки остатков"
+        indexes = [models.Index(fields=['product', 'taken_at'], name='stock_snapshot_product_idx')]
@@ -0,0 +1,152 @@
+from django.contrib.admin.views.main import ALL_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+CURSOR_VARS = (AFTER_VAR, BEFORE_VAR)
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Paginator that stops counting at ``count_limit`` rows, so the count
+    costs the same on a filtered million-row list as on a small one.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def counted(self):
+        return self.object_list.order_by()[:self.count_limit + 1].count()
+
+    @cached_property
+    def count(self):
+        return min(self.counted, self.count_limit)
+
+    @property
+    def count_capped(self):
+        return self.counted > self.count_limit
+
+
+def keyset_filter(ordering, values, after=True):
+    """
+    Rows that come after (or before) the row whose ``ordering`` fields have
+    ``values``, for ``ordering`` like ``('name', 'pk')`` or ``('-pk',)``.
+
+    The leading field also gets a plain range bound so that the database
+    seeks into its index instead of scanning from the start.
+    """
+    lookups = []
+    for field in ordering:
+        ascending = not field.startswith('-')
+        lookups.append((field.lstrip('-'), 'gt' if ascending == after else 'lt'))
+
+    (first, first_lookup), first_value = lookups[0], values[0]
+    if len(lookups) == 1:
+        return Q(**{f'{first}__{first_lookup}': first_value})
+
+    seek, equal = Q(), {}
+    for (field, lookup), value in zip(lookups, values):
+        seek |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return Q(**{f'{first}__{first_lookup}e': first_value}) & seek
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList paged by keyset (seek) instead of OFFSET while it is sorted
+    by the ``keyset_ordering`` of its ModelAdmin: a page holds the rows
+    after (``?after=<pk>``) or before (``?before=<pk>``) a given row, so the
+    5000th page costs the same as the first. Sorted by another column, it
+    falls back to numbered pages. Counts come from CappedCountPaginator.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # Filter, search and sort links start again from the first page.
+        for name in CURSOR_VARS:
+            self.params.pop(name, None)
+            self.filter_params.pop(name, None)
+
+        if self.keyset:
+            self.first_page_url = self.get_query_string()
+            self.previous_page_url = self.next_page_url = None
+            if self.has_previous:
+                self.previous_page_url = self.get_query_string({BEFORE_VAR: self.result_list[0].pk})
+            if self.has_next:
+                self.next_page_url = self.get_query_string({AFTER_VAR: self.result_list[-1].pk})
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in CURSOR_VARS:
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def cursor_values(self, pk):
+        """Values of the keyset fields for the row ``pk``, None if there is no such row."""
+        if not pk:
+            return None
+        fields = [field.lstrip('-') for field in self.model_admin.keyset_ordering]
+        try:
+            return self.model._default_manager.filter(pk=pk).values_list(*fields).first()
+        except (ValueError, ValidationError):
+            return None
+
+    def get_results(self, request):
+        ordering = tuple(self.model_admin.keyset_ordering)
+        # The admin may repeat the ordering and append a pk tiebreaker; what
+        # follows the keyset (which ends with the pk) changes nothing.
+        applied = tuple(dict.fromkeys(self.queryset.query.order_by))
+        self.keyset = applied[:len(ordering)] == ordering and ALL_VAR not in request.GET
+        if not self.keyset:
+            super().get_results(request)
+            self.count_capped = self.paginator.count_capped
+            return
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        per_page = self.list_per_page
+
+        after = self.cursor_values(request.GET.get(AFTER_VAR))
+        before = None if after else self.cursor_values(request.GET.get(BEFORE_VAR))
+
+        rows = []
+        if not before:
+            queryset = self.queryset.filter(keyset_filter(ordering, after)) if after else self.queryset
+            rows = list(queryset[:per_page + 1])
+            self.has_previous, self.has_next = bool(after), len(rows) > per_page
+            rows = rows[:per_page]
+
+        if before or (after and not rows):
+            # Pages backwards; past the last row this shows the last page.
+            queryset = self.queryset.reverse()
+            if before:
+                queryset = queryset.filter(keyset_filter(ordering, before, after=False))
+            rows = list(queryset[:per_page + 1])
+            self.has_previous, self.has_next = len(rows) > per_page, bool(before)
+            rows = rows[:per_page][::-1]
+
+        self.result_count = paginator.count
+        self.count_capped = paginator.count_capped
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.has_previous or self.has_next
+        self.paginator = paginator
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin mixin for very long changelists: capped result counts and
+    keyset pagination along ``keyset_ordering``, which must be indexed,
+    end with the primary key and contain no nullable fields.
+    """
+    keyset_ordering = ('-pk',)
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db.models import F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Ceil, Coalesce, Greatest, NullIf
+from django.utils import timezone
+
+from apps.sales.models import ProductSalesDay
+
+
+SHORT_WINDOW = 30
+LONG_WINDOW = 90
+LEAD_TIME = 14
+COVER_DAYS = 30
+
+
+def sold_since(day):
+    """Units of the product sold from ``day`` on, read from the daily sales rollup."""
+    sold = (
+        ProductSalesDay.objects.filter(product=OuterRef('pk'), day__gte=day)
+        .values('product').annotate(total=Sum('quantity')).values('total').order_by()
+    )
+    return Coalesce(Subquery(sold), 0)
+
+
+def daily_rate(sold, days):
+    return Cast(sold, FloatField()) / Value(float(days))
+
+
+def with_reorder(queryset, short_window=SHORT_WINDOW, long_window=LONG_WINDOW,
+                 lead_time=LEAD_TIME, cover_days=COVER_DAYS):
+    """
+    Annotate reorder figures, computed by the database in one query:
+
+    - ``sold_short``/``sold_long``: units sold in the last ``short_window``
+      and ``long_window`` days (today included);
+    - ``daily_sales``: the higher of the two average daily sales, so that a
+      recent rise in demand is planned for at once;
+    - ``days_of_cover``: days the stock lasts at that rate (NULL without sales);
+    - ``suggested_quantity``: units to order so that the stock covers the
+      ``lead_time`` of the supplier plus ``cover_days`` more.
+    """
+    today = timezone.localdate()
+    return queryset.annotate(
+        sold_short=sold_since(today - timedelta(days=short_window - 1)),
+        sold_long=sold_since(today - timedelta(days=long_window - 1)),
+    ).annotate(
+        daily_sales=Greatest(daily_rate('sold_short', short_window), daily_rate('sold_long', long_window)),
+    ).annotate(
+        days_of_cover=Cast(F('quantity'), FloatField()) / NullIf(F('daily_sales'), Value(0.0)),
+        suggested_quantity=Greatest(
+            Cast(Ceil(F('daily_sales') * Value(float(lead_time + cover_days))), IntegerField()) - F('quantity'),
+            Value(0),
+        ),
+    )
+
+
+def reorder_suggestions(queryset, **params):
+    """Products worth reordering, the ones running out first on top."""
+    return with_reorder(queryset, **params).filter(suggested_quantity__gt=0).order_by('days_of_cover', 'name', 'pk')
@@ -0,0 +1,149 @@
+import json
+import tempfile
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib import messages
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.module_loading import import_string
+
+from .models import ReportJob
+
+
+# kind -> (builder, title, file name). A builder takes the queryset, the
+# job's ``args`` and a ``progress`` callback and returns a StreamingSheet.
+REPORTS = {
+    'warehouse_stock': (
+        'apps.main.exports.warehouse_stock_report', "Остатки склада", 'warehouse_stock.xlsx',
+    ),
+    'sale_items': (
+        'apps.sales.exports.sale_items_report', "Товары продажи", 'sale_items.xlsx',
+    ),
+}
+
+
+def report_title(kind):
+    return REPORTS[kind][1] if kind in REPORTS else kind
+
+
+def enqueue_report(request, kind, queryset, *args):
+    """
+    Queue ``kind`` to be built by ``run_report_worker``.
+
+    The queryset is stored as plain data in ``params``: the primary keys
+    of its rows and its field ordering, from which the worker rebuilds it.
+    """
+    ordering = list(dict.fromkeys(field for field in queryset.query.order_by if isinstance(field, str)))
+    return ReportJob.objects.create(
+        kind=kind,
+        model=queryset.model._meta.label,
+        params={
+            'pks': list(queryset.order_by().values_list('pk', flat=True)),
+            'ordering': ordering,
+            'args': list(args),
+        },
+        created_by=request.user,
+    )
+
+
+def selected_pks(pks):
+    """
+    Subquery of ``pks`` bound as a single parameter, so that a selection of
+    any size fits the limit databases put on the parameters of a query.
+    """
+    if connection.vendor == 'postgresql':
+        return RawSQL('SELECT unnest(%s::bigint[])', (pks,))
+    return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(pks),))
+
+
+def job_queryset(job):
+    """The queryset ``job`` was queued for, rebuilt from its ``params``."""
+    queryset = apps.get_model(job.model)._default_manager.filter(pk__in=selected_pks(job.params.get('pks', [])))
+    return queryset.order_by(*job.params['ordering']) if job.params.get('ordering') else queryset
+
+
+def queue_report_action(modeladmin, request, kind, queryset, *args):
+    """Body of the "in background" admin actions."""
+    job = enqueue_report(request, kind, queryset, *args)
+    modeladmin.message_user(request, format_html(
+        'Отчёт «{}» поставлен в очередь: <a href="{}">задача #{}</a>',
+        report_title(kind), reverse('admin:main_reportjob_changelist'), job.pk,
+    ), messages.SUCCESS)
+
+
+def claim_next_job():
+    """
+    Mark the oldest pending job as running and return it, or None.
+
+    On PostgreSQL a worker skips the jobs other workers are claiming
+    instead of waiting for their row locks (SKIP LOCKED); SQLite ignores
+    the lock and relies on the conditional update below.
+    """
+    while True:
+        with transaction.atomic():
+            job = (
+                ReportJob.objects.select_for_update(skip_locked=True)
+                .filter(status='pending').order_by('created_at').first()
+            )
+            if job is None:
+                return None
+
+            now = timezone.now()
+            claimed = ReportJob.objects.filter(pk=job.pk, status='pending').update(
+                status='running', started_at=now, heartbeat_at=now,
+            )
+
+        # Another worker may have claimed the job in between.
+        if claimed:
+            job.status = 'running'
+            return job
+
+
+def fail_stale_jobs(timeout):
+    """
+    Fail the running jobs whose worker stopped (killed, redeployed) before
+    finishing them, seen as no progress for ``timeout`` seconds; otherwise
+    they would stay running forever. Returns how many were failed.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=timeout)
+    return ReportJob.objects.filter(
+        Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True, started_at__lt=stale_before),
+        status='running',
+    ).update(
+        status='failed', finished_at=now,
+        error=f"Формирование прервано: обработчик не отвечал {timeout} с. Поставьте отчёт в очередь заново.",
+    )
+
+
+def run_report_job(job):
+    builder, _, filename = REPORTS[job.kind]
+
+    def progress(done, total):
+        ReportJob.objects.filter(pk=job.pk).update(
+            progress=min(99, done * 100 // max(total, 1)), heartbeat_at=timezone.now(),
+        )
+
+    try:
+        sheet = import_string(builder)(job_queryset(job), *job.params.get('args', []), progress=progress)
+
+        with tempfile.TemporaryFile() as tmp:
+            sheet.save(tmp)
+            tmp.seek(0)
+            job.result.save(filename, File(tmp), save=False)
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+    else:
+        job.status = 'done'
+        job.progress = 100
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result', 'error', 'finished_at'])
@@ -0,0 +1,120 @@
+import sys
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Q
+
+from .models import Product, ProductCompatibility
+from .utils import normalize_article, normalize_name
+
+
+def prefix_lookup(field, key):
+    """
+    Exact or prefix match of an already normalized ``key``, written as a
+    range (``key <= value < next key``) so that any database answers it
+    from the index on ``field``.
+    """
+    return Q(**{
+        f'{field}__gte': key,
+        f'{field}__lt': key[:-1] + chr(ord(key[-1]) + 1),
+    })
+
+
+def article_key_lookup(field, article_number):
+    return prefix_lookup(field, normalize_article(article_number))
+
+
+def looks_like_article(term):
+    """Whether ``term`` is searched as an article number: long enough and with digits."""
+    key = normalize_article(term)
+    return len(key) >= ArticleSearchMixin.article_min_length and any(char.isdigit() for char in key)
+
+
+def vehicle_lookup(vehicle):
+    """Products compatible with ``vehicle`` ("camry" finds "CAMRY 40" and "CAMRY 50")."""
+    return Q(pk__in=ProductCompatibility.objects.filter(
+        prefix_lookup('vehicle', normalize_name(vehicle))
+    ).values('product_id'))
+
+
+def product_search_lookup(term):
+    """
+    Single indexed range lookup for the product autocomplete, run on every
+    keystroke: the article key prefix for a term shaped like an article
+    number, otherwise the prefix of the (normalized, upper case) name.
+    """
+    if looks_like_article(term):
+        return article_key_lookup('article_key', term)
+    return prefix_lookup('name', normalize_name(term))
+
+
+# Product fields of the plain text search given a trigram index on PostgreSQL.
+TRIGRAM_FIELDS = ('name', 'article_number')
+
+
+def create_trigram_indexes(using=DEFAULT_DB_ALIAS, verbosity=1, stdout=None, **kwargs):
+    """
+    post_migrate handler: on PostgreSQL, index the text search fields with
+    pg_trgm so that ``icontains`` (``UPPER(column::text) LIKE UPPER('%term%')``)
+    is answered from the index instead of a scan of every product. They are
+    not in Product.Meta because SQLite has no such index. Without the pg_trgm
+    extension the search keeps working, only without the indexes.
+    """
+    connection = connections[using]
+    table = Product._meta.db_table
+    if connection.vendor != 'postgresql' or table not in connection.introspection.table_names():
+        return
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError as error:
+            if verbosity:
+                (stdout or sys.stdout).write(f"Trigram search indexes skipped, pg_trgm is not available: {error}\n")
+            return
+
+        for name in TRIGRAM_FIELDS:
+            column = Product._meta.get_field(name).column
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {quote(f"{table}_{column}_trgm")} '
+                f'ON {quote(table)} USING gin ((UPPER({quote(column)}::text)) gin_trgm_ops)'
+            )
+
+
+class ArticleSearchMixin:
+    """
+    Admin search that looks a term shaped like an article number up through
+    the indexed article key, whatever its spaces and dashes, and answers with
+    those matches alone: OR'ed with the ``search_fields`` scan the index
+    would not be used. Other terms, and articles nothing matches, fall back
+    to the regular search.
+    """
+    article_key_field = 'article_key'
+    article_min_length = 3
+
+    def get_search_results(self, request, queryset, search_term):
+        if looks_like_article(search_term):
+            matches = queryset.filter(article_key_lookup(self.article_key_field, search_term))
+            if matches.exists():
+                return matches, False
+
+        return super().get_search_results(request, queryset, search_term)
+
+
+class VehicleSearchMixin:
+    """
+    Admin search that looks a term up as a vehicle model in the
+    ProductCompatibility index first and answers with those matches alone,
+    an indexed filter of its own rather than a branch of the scanning OR.
+    Terms no vehicle matches fall back to the regular ``search_fields``.
+    """
+    vehicle_min_length = 2
+
+    def get_search_results(self, request, queryset, search_term):
+        if len(normalize_name(search_term)) >= self.vehicle_min_length:
+            matches = queryset.filter(vehicle_lookup(search_term))
+            if matches.exists():
+                return matches, False
+
+        return super().get_search_results(request, queryset, search_term)
@@ -1,62 +1,91 @@
+from django.db.models import F
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 
-from .models import Product, ArrivalProduct
-from .utils import normalize_name
+from .models import Arrival, ArrivalProduct, CurrencyRate, Product, StockMovement
+from .compatibility import sync_compatibility
+from .currency import invalidate_currency_rates
+from .stock import arrival_moment, post_arrival_movements, record_movement, redate_movements, remove_arrival_item
+from .utils import normalize_article, normalize_name
+
+
+@receiver(pre_save, sender=Arrival)
+def arrival_pre_save(sender, instance, **kwargs):
+    instance._old_date = None
+    if not instance._state.adding:
+        instance._old_date = Arrival.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+
+@receiver(post_save, sender=Arrival)
+def arrival_post_save(sender, instance, created, **kwargs):
+    # Stock movements are dated the arrival date.
+    if instance._old_date is not None and instance._old_date != instance.date:
+        redate_movements(StockMovement.objects.filter(arrival_item__arrival=instance), arrival_moment(instance))
 
 
 @receiver(pre_save, sender=ArrivalProduct)
 def arrivalproduct_pre_save(sender, instance, **kwargs):
     instance.name = normalize_name(instance.name)
+    instance.article_key = normalize_article(instance.article_number)
 
     if not instance.pk:
         instance._old_quantity = 0
+        instance._old_cost_price = 0
         return
 
     old = ArrivalProduct.objects.get(pk=instance.pk)
     instance._old_quantity = old.quantity
+    instance._old_cost_price = old.cost_price
 
 
 @receiver(post_save, sender=ArrivalProduct)
 def arrivalproduct_post_save(sender, instance, created, **kwargs):
-    product = Product.objects.filter(
-        warehouse=instance.arrival.warehouse,
-        article_number=instance.article_number,
-        brand=instance.brand,
-        country_of_origin=instance.arrival.country_of_origin,
-        name=instance.name,
-    ).first()
-
-    if not product:
-        product = Product.objects.create(
-            warehouse=instance.arrival.warehouse,
-            name=instance.name,
-            article_number=instance.article_number,
-            brand=instance.brand,
-            country_of_origin=instance.arrival.country_of_origin,
-            quantity=0,
-            cost_price=instance.cost_price,
-            suits_for=instance.suits_for,
-        )
-
     delta = instance.quantity if created else instance.quantity - instance._old_quantity
+    total_delta = instance.quantity * instance.cost_price - instance._old_quantity * instance._old_cost_price
+    post_arrival_movements(instance.arrival, [(instance, delta, total_delta)])
 
-    product.quantity = max(0, product.quantity + delta)
-    product.cost_price = instance.cost_price
-    product.save()
+    Arrival.objects.filter(pk=instance.arrival_id).update(total_amount=F('total_amount') + total_delta)
 
 
 @receiver(post_delete, sender=ArrivalProduct)
 def arrivalproduct_post_delete(sender, instance, **kwargs):
-    try:
-        product = Product.objects.get(
-            warehouse=instance.arrival.warehouse,
-            article_number=instance.article_number,
-            name=instance.name,  
-            brand=instance.brand,
-            country_of_origin=instance.arrival.country_of_origin,
-        )
-        product.quantity = max(0, product.quantity - instance.quantity)
-        product.save()
-    except Product.DoesNotExist:
-        pass
+    Arrival.objects.filter(pk=instance.arrival_id).update(
+        total_amount=F('total_amount') - instance.quantity * instance.cost_price
+    )
+
+    remove_arrival_item(instance)
+
+
+def saves_field(update_fields, field):
+    return update_fields is None or field in update_fields
+
+
+@receiver(pre_save, sender=Product)
+def product_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance.article_key = normalize_article(instance.article_number)
+    instance._old_quantity, instance._old_suits_for = 0, None
+
+    if instance._state.adding or not (
+        saves_field(update_fields, 'quantity') or saves_field(update_fields, 'suits_for')
+    ):
+        return
+
+    old = Product.objects.filter(pk=instance.pk).values_list('quantity', 'suits_for').first()
+    if old is not None:
+        instance._old_quantity, instance._old_suits_for = old
+
+
+@receiver(post_save, sender=Product)
+def product_post_save(sender, instance, created, update_fields=None, **kwargs):
+    # Quantities edited by hand (admin, shell) are ledger adjustments.
+    if saves_field(update_fields, 'quantity'):
+        record_movement(instance.pk, instance.quantity - instance._old_quantity, 'adjustment')
+
+    if saves_field(update_fields, 'suits_for') and instance.suits_for != instance._old_suits_for:
+        sync_compatibility([instance])
+
+
+@receiver(post_save, sender=CurrencyRate)
+@receiver(post_delete, sender=CurrencyRate)
+def currencyrate_changed(sender, instance, **kwargs):
+    invalidate_currency_rates()
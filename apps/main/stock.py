@@ -0,0 +1,306 @@
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .compatibility import sync_compatibility
+from .models import Product, Arrival, ArrivalProduct, StockMovement, StockSnapshot
+from .utils import normalize_article, normalize_name
+
+
+ARRIVAL_ITEM_FIELDS = (
+    'product', 'name', 'article_number', 'article_key', 'quantity', 'cost_price', 'brand', 'suits_for',
+)
+
+
+COST_QUANT = Decimal('0.01')
+
+
+def average_cost(quantity, cost_price, quantity_delta, value_delta, unit_cost):
+    """
+    Moving weighted-average unit cost of ``quantity`` units at ``cost_price``
+    after ``quantity_delta`` units worth ``value_delta`` in total come in
+    (or go out). An empty stock takes ``unit_cost``, the unit cost of the
+    incoming units; a stock that runs out keeps its last average.
+    """
+    if cost_price is None or quantity <= 0:
+        return unit_cost if quantity_delta > 0 or cost_price is None else cost_price
+
+    new_quantity = quantity + quantity_delta
+    if new_quantity <= 0:
+        return cost_price
+    return (max(quantity * cost_price + value_delta, 0) / new_quantity).quantize(COST_QUANT)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f"Недостаточно товара на складе (товар #{product_id}, требуется {quantity} шт.)")
+
+
+def arrival_moment(arrival):
+    """Time of the stock movements of ``arrival``: the start of its date."""
+    # An arrival created in code may still hold the date as a string.
+    date = Arrival._meta.get_field('date').to_python(arrival.date)
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def shift_snapshots(quantities, since, until=None):
+    """
+    Add ``quantities`` (product id -> units) to the snapshots taken from
+    ``since`` (up to ``until``). A snapshot holds the movements dated up to
+    it, and a movement dated before a snapshot that already exists is not
+    in it yet: ``as_of`` would otherwise miss it. One UPDATE for all products.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+
+    snapshots = StockSnapshot.objects.filter(product_id__in=quantities, taken_at__gte=since)
+    if until is not None:
+        snapshots = snapshots.filter(taken_at__lt=until)
+    snapshots.update(quantity=F('quantity') + Case(
+        *(When(product_id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()),
+        default=Value(0),
+    ))
+
+
+def record_movement(product_id, quantity, kind, moment=None, **links):
+    """
+    Append a stock change to the StockMovement ledger, dated ``moment``,
+    the date of its document, or now.
+    """
+    if not quantity:
+        return
+    if moment is None:
+        moment = timezone.now()
+    else:
+        shift_snapshots({product_id: quantity}, moment)
+    StockMovement.objects.create(product_id=product_id, quantity=quantity, kind=kind, created_at=moment, **links)
+
+
+def redate_movements(movements, moment):
+    """
+    Move ``movements`` (a StockMovement queryset) to ``moment`` when the
+    date of their document changes, and the snapshots in between with them.
+    """
+    moved = defaultdict(lambda: defaultdict(int))
+    for product_id, quantity, created_at in movements.values_list('product', 'quantity', 'created_at'):
+        moved[created_at][product_id] += quantity
+
+    for created_at, quantities in moved.items():
+        if created_at > moment:
+            shift_snapshots(quantities, moment, until=created_at)
+        elif created_at < moment:
+            shift_snapshots({product_id: -quantity for product_id, quantity in quantities.items()},
+                            created_at, until=moment)
+    movements.update(created_at=moment)
+
+
+def take_from_stock(product_id, quantity, sale_item=None, moment=None):
+    """
+    Atomically remove ``quantity`` units, only if that many are in stock.
+
+    The check and the decrement are one conditional UPDATE, so concurrent
+    sales of the same product can neither oversell nor lose an update.
+    """
+    taken = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity
+    )
+    if not taken:
+        raise InsufficientStock(product_id, quantity)
+    record_movement(product_id, -quantity, 'sale', moment, sale_item=sale_item)
+
+
+@transaction.atomic
+def return_to_stock(product_id, quantity, sale_item=None, unit_cost=None, moment=None):
+    """
+    Put ``quantity`` sold units back. They re-enter the average cost at
+    ``unit_cost``, the cost they were sold at, when it is known.
+    """
+    changes = {'quantity': F('quantity') + quantity}
+    if unit_cost is not None:
+        product = Product.objects.select_for_update().only('quantity', 'cost_price').get(pk=product_id)
+        cost_price = average_cost(product.quantity, product.cost_price, quantity, quantity * unit_cost, unit_cost)
+        if cost_price != product.cost_price:
+            # A queryset update skips auto_now; the autofill cache keys on updated_at.
+            changes.update(cost_price=cost_price, updated_at=timezone.now())
+
+    Product.objects.filter(pk=product_id).update(**changes)
+    record_movement(product_id, quantity, 'sale', moment, sale_item=sale_item)
+
+
+def move_stock(product_id, quantity_delta, sale_item=None, unit_cost=None, moment=None):
+    """Sell ``quantity_delta`` units, or take them back (at ``unit_cost``) when it is negative."""
+    if quantity_delta > 0:
+        take_from_stock(product_id, quantity_delta, sale_item, moment)
+    elif quantity_delta < 0:
+        return_to_stock(product_id, -quantity_delta, sale_item, unit_cost, moment)
+
+
+def stock_key(article_number, brand_id, name):
+    """
+    Identity of a Product within the warehouse and country of an arrival,
+    as enforced by the ``product_unique_stock_key`` constraint.
+    """
+    return (article_number or '', brand_id, name)
+
+
+def article_filter(article_number):
+    """Match an article number the way the unique constraint does (None == '')."""
+    if article_number:
+        return Q(article_number=article_number)
+    return Q(article_number__isnull=True) | Q(article_number='')
+
+
+def resolve_arrival_products(arrival, items):
+    """
+    Products matching ``items`` of ``arrival`` by stock key, fetched (and
+    locked) with one query. Where several rows share a key the oldest wins,
+    like ``.filter(...).first()`` did.
+    """
+    candidates = Product.objects.select_for_update().filter(
+        warehouse_id=arrival.warehouse_id,
+        country_of_origin_id=arrival.country_of_origin_id,
+        name__in={item.name for item in items},
+        brand_id__in={item.brand_id for item in items},
+    ).order_by('pk')
+
+    products = {}
+    for product in candidates:
+        products.setdefault(stock_key(product.article_number, product.brand_id, product.name), product)
+    return products
+
+
+@transaction.atomic
+def post_arrival_movements(arrival, movements):
+    """
+    Apply ``(item, quantity_delta, value_delta)`` changes of ``arrival``
+    lines to stock in order.
+
+    Same result as saving the lines one by one: a missing Product is
+    created with zero stock, then every line moves its quantity (never
+    below zero) and its value into the weighted-average cost price. All
+    matching Products are read in one query, created with ``bulk_create``
+    and written with ``bulk_update``; the applied changes are appended to
+    the StockMovement ledger, dated the arrival date.
+
+    The Products stay row-locked (``select_for_update``) until the
+    surrounding transaction ends, so concurrent writers cannot interleave
+    between the read and the write.
+    """
+    products = resolve_arrival_products(arrival, [item for item, _, _ in movements])
+    created, changed, applied = [], {}, []
+
+    for item, delta, value_delta in movements:
+        key = stock_key(item.article_number, item.brand_id, item.name)
+        product = products.get(key)
+
+        if product is None:
+            product = products[key] = Product(
+                warehouse_id=arrival.warehouse_id,
+                name=item.name,
+                article_number=item.article_number,
+                article_key=normalize_article(item.article_number),
+                brand_id=item.brand_id,
+                country_of_origin_id=arrival.country_of_origin_id,
+                quantity=0,
+                cost_price=item.cost_price,
+                suits_for=item.suits_for,
+            )
+            created.append(product)
+        elif product.pk is not None:
+            changed[product.pk] = product
+
+        quantity = max(0, product.quantity + delta)
+        cost_price = average_cost(
+            product.quantity, product.cost_price, quantity - product.quantity, value_delta, item.cost_price
+        )
+        applied.append((product, item, quantity - product.quantity))
+        product.quantity = quantity
+        if product.cost_price != cost_price:
+            product.cost_price = cost_price
+            product.updated_at = timezone.now()
+
+    Product.objects.bulk_create(created)
+    Product.objects.bulk_update(changed.values(), ['quantity', 'cost_price', 'updated_at'])
+    sync_compatibility(created)
+
+    moment = arrival_moment(arrival)
+    moved = defaultdict(int)
+    for product, item, quantity in applied:
+        moved[product.pk] += quantity
+    shift_snapshots(moved, moment)
+    StockMovement.objects.bulk_create(
+        StockMovement(product=product, quantity=quantity, kind='arrival', arrival_item=item, created_at=moment)
+        for product, item, quantity in applied
+        if quantity
+    )
+
+
+@transaction.atomic
+def save_arrival_items(arrival, items):
+    """
+    Save new and changed lines of ``arrival`` and post them to stock in bulk.
+
+    Replaces the per-row pre_save/post_save signal round trips when a whole
+    formset is saved: old quantities are read in one query, lines are
+    written with ``bulk_create``/``bulk_update`` (which send no signals) and
+    stock and the arrival total are updated once.
+    """
+    for item in items:
+        item.arrival = arrival
+        item.name = normalize_name(item.name)
+        item.article_key = normalize_article(item.article_number)
+
+    new_items = [item for item in items if item.pk is None]
+    old_items = [item for item in items if item.pk is not None]
+
+    old_values = {
+        pk: (quantity, cost_price)
+        for pk, quantity, cost_price in ArrivalProduct.objects.filter(
+            pk__in=[item.pk for item in old_items]
+        ).values_list('pk', 'quantity', 'cost_price')
+    }
+
+    movements, total_delta = [], 0
+    for item in items:
+        old_quantity, old_cost_price = old_values.get(item.pk, (0, 0))
+        value_delta = item.quantity * item.cost_price - old_quantity * old_cost_price
+        movements.append((item, item.quantity - old_quantity, value_delta))
+        total_delta += value_delta
+
+    ArrivalProduct.objects.bulk_update(old_items, ARRIVAL_ITEM_FIELDS)
+    ArrivalProduct.objects.bulk_create(new_items)
+
+    post_arrival_movements(arrival, movements)
+
+    Arrival.objects.filter(pk=arrival.pk).update(total_amount=F('total_amount') + total_delta)
+
+
+@transaction.atomic
+def remove_arrival_item(item):
+    """Take a deleted arrival line back out of stock, never below zero."""
+    product = Product.objects.select_for_update().filter(
+        article_filter(item.article_number),
+        warehouse_id=item.arrival.warehouse_id,
+        name=item.name,
+        brand_id=item.brand_id,
+        country_of_origin_id=item.arrival.country_of_origin_id,
+    ).only('quantity', 'cost_price').first()
+    if product is None:
+        return
+
+    removed = min(product.quantity, item.quantity)
+    changes = {'quantity': F('quantity') - removed}
+    cost_price = average_cost(
+        product.quantity, product.cost_price, -removed, -removed * item.cost_price, item.cost_price
+    )
+    if cost_price != product.cost_price:
+        changes.update(cost_price=cost_price, updated_at=timezone.now())
+    Product.objects.filter(pk=product.pk).update(**changes)
+    record_movement(product.pk, -removed, 'arrival', arrival_moment(item.arrival))
@@ -0,0 +1,192 @@
+import tempfile
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Arrival, ArrivalProduct, Brand, Country, Product, ReportJob, StockMovement, Warehouse
+from .search import product_search_lookup
+from .stock import save_arrival_items
+
+
+class ProductSearchTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Склад")
+        cls.brand = Brand.objects.create(name="Bosch")
+        cls.country = Country.objects.create(name="Germany")
+        cls.user = get_user_model().objects.create_superuser(email='admin@example.com', password='x')
+
+    def create_product(self, name, article_number=None, suits_for=None):
+        return Product.objects.create(
+            name=name, article_number=article_number, suits_for=suits_for, quantity=1,
+            warehouse=self.warehouse, brand=self.brand, country_of_origin=self.country,
+        )
+
+    def admin_search(self, term):
+        request = RequestFactory().get('/', {'q': term})
+        request.user = self.user
+        model_admin = admin.site.get_model_admin(Product)
+        queryset, _ = model_admin.get_search_results(request, Product.objects.all(), term)
+        return queryset
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertNotIn('SCAN main_product', plan)
+        self.assertIn(index, plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite query plans.")
+class ArticleSearchTests(ProductSearchTestMixin, TestCase):
+    def test_article_search_uses_the_article_key_index(self):
+        pump = self.create_product("PUMP", article_number="0 986-452 041")
+        self.create_product("FILTER 0986", article_number="77-1")
+
+        queryset = self.admin_search("0986-452")
+
+        self.assertEqual(list(queryset), [pump])
+        self.assertUsesIndex(queryset, 'article_key')
+
+    def test_unmatched_article_falls_back_to_text_search(self):
+        mat = self.create_product("MAT 2107")
+
+        self.assertEqual(list(self.admin_search("2107")), [mat])
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite query plans.")
+class VehicleSearchTests(ProductSearchTestMixin, TestCase):
+    def test_vehicle_search_uses_the_compatibility_index(self):
+        pump = self.create_product("PUMP", suits_for="Camry 40, Corolla")
+        self.create_product("CAMRY MAT")
+
+        queryset = self.admin_search("camry")
+
+        self.assertEqual(list(queryset), [pump])
+        self.assertUsesIndex(queryset, 'vehicle')
+
+    def test_unmatched_vehicle_falls_back_to_text_search(self):
+        mat = self.create_product("CAMRY MAT")
+
+        self.assertEqual(list(self.admin_search("mat")), [mat])
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite query plans.")
+class ProductAutocompleteTests(ProductSearchTestMixin, TestCase):
+    def autocomplete(self, term):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('product_autocomplete'), {'term': term})
+        return [result['name'] for result in response.json()['results']]
+
+    def test_name_prefix_uses_the_name_index(self):
+        self.create_product("PUMP")
+        self.create_product("OIL PUMP")
+
+        self.assertEqual(self.autocomplete("pu"), ["PUMP"])
+        self.assertUsesIndex(
+            Product.objects.filter(product_search_lookup("pu")).order_by('name', 'pk'), 'product_name_idx',
+        )
+
+    def test_article_uses_the_article_key_index(self):
+        self.create_product("PUMP", article_number="0 986-452 041")
+
+        self.assertEqual(self.autocomplete("0986 452"), ["PUMP"])
+        self.assertUsesIndex(Product.objects.filter(product_search_lookup("0986 452")), 'article_key')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobDownloadTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create_user(email='author@example.com', password='x', is_staff=True)
+        self.other = User.objects.create_user(email='other@example.com', password='x', is_staff=True)
+        self.job = ReportJob.objects.create(
+            kind='warehouse_stock', model='main.Product', status='done', created_by=self.author,
+        )
+        self.job.result.save('warehouse_stock.xlsx', ContentFile(b'xlsx'))
+        self.url = reverse('report_job_download', args=[self.job.pk])
+
+    def download(self, user):
+        self.client.force_login(get_user_model().objects.get(pk=user.pk))
+        return self.client.get(self.url)
+
+    def test_author_downloads_the_report(self):
+        self.assertEqual(self.download(self.author).status_code, 200)
+
+    def test_other_staff_get_not_found(self):
+        self.assertEqual(self.download(self.other).status_code, 404)
+
+    def test_view_permission_allows_any_report(self):
+        self.other.user_permissions.add(Permission.objects.get(codename='view_reportjob'))
+        self.assertEqual(self.download(self.other).status_code, 200)
+
+
+class ArrivalPostingTests(TestCase):
+    """
+    The bulk ``save_arrival_items`` path of the arrival admin must leave the
+    same stock, costs, totals and ledger as saving the lines one by one
+    through the signals. The same edits run in two warehouses, one per path.
+    """
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Bosch")
+        self.country = Country.objects.create(name="Germany")
+
+    def run_arrival(self, save):
+        warehouse = Warehouse.objects.create(name=f"Склад {save.__name__}")
+        # Stock on hand before the arrival, at another cost.
+        Product.objects.create(
+            name="РЕМЕНЬ", article_number="B-1", quantity=2, cost_price=Decimal('5.00'),
+            warehouse=warehouse, brand=self.brand, country_of_origin=self.country,
+        )
+        arrival = Arrival.objects.create(warehouse=warehouse, country_of_origin=self.country,
+                                         date=timezone.localdate())
+
+        def line(name, article_number, quantity, cost_price):
+            return ArrivalProduct(name=name, article_number=article_number, quantity=quantity,
+                                  cost_price=Decimal(cost_price), brand=self.brand)
+
+        pump = line("Помпа", "P-1", 5, '10.00')
+        filter_ = line("Фильтр", None, 3, '20.00')
+        belt = line("Ремень", "B-1", 4, '8.00')
+        save(arrival, [pump, filter_, belt])
+
+        pump.quantity = 8
+        filter_.cost_price = Decimal('25.00')
+        save(arrival, [pump, filter_])
+
+        belt.delete()
+
+        arrival.refresh_from_db()
+        products = Product.objects.filter(warehouse=warehouse)
+        return {
+            'products': sorted(products.values_list('name', 'article_number', 'quantity', 'cost_price')),
+            'total_amount': arrival.total_amount,
+            'movements': sorted(
+                StockMovement.objects.filter(product__in=products)
+                .values_list('product__name', 'kind', 'quantity', 'arrival_item__name')
+            ),
+        }
+
+    def test_bulk_save_matches_the_signals(self):
+        def by_signals(arrival, items):
+            for item in items:
+                item.arrival = arrival
+                item.save()
+
+        def in_bulk(arrival, items):
+            save_arrival_items(arrival, items)
+
+        signals, bulk = self.run_arrival(by_signals), self.run_arrival(in_bulk)
+
+        self.assertEqual(bulk, signals)
+        self.assertEqual(signals['total_amount'], Decimal('155.00'))
+        self.assertIn(('ПОМПА', 'P-1', 8, Decimal('10.00')), signals['products'])
+        self.assertIn(('ФИЛЬТР', None, 3, Decimal('25.00')), signals['products'])
+        self.assertIn(('РЕМЕНЬ', 'B-1', 2, Decimal('5.00')), signals['products'])
@@ -2,7 +2,7 @@ from django.utils.dateparse import parse_date
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
 
-from .models import CurrencyRate
+from .currency import get_selected_currency
 
 
 def normalize_name(name: str) -> str:
@@ -11,11 +11,18 @@ def normalize_name(name: str) -> str:
     return ' '.join(name.strip().upper().split())
 
 
+def normalize_article(article_number: str) -> str:
+    """'0 986-452 041' -> '0986452041': letters and digits only, upper case."""
+    if not article_number:
+        return ''
+    return ''.join(char for char in article_number.upper() if char.isalnum())
+
+
 def convert_from_usd(amount):
     if amount is None:
         return None
 
-    selected_currency = CurrencyRate.objects.filter(selected=True).first()
+    selected_currency = get_selected_currency()
 
     if not selected_currency:
         return f"{amount} USD"
@@ -27,6 +34,21 @@ def convert_from_usd(amount):
     return f"{converted} {selected_currency.currency_code}"
 
 
+def format_currency(amount):
+    """Label an amount already converted by ``currency.converted``."""
+    if amount is None:
+        return None
+
+    # SQLite hands computed decimals back without their scale.
+    amount = Decimal(amount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    selected_currency = get_selected_currency()
+
+    if not selected_currency:
+        return f"{amount} USD"
+
+    return f"{amount} {selected_currency.currency_code}"
+
+
 def parse_admin_date(value):
     """
     Supports:
@@ -1,24 +1,134 @@
+import hashlib
+import json
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import render
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
-from .models import CurrencyRate, Product
+from django.http import JsonResponse, FileResponse, Http404
+from django.utils.cache import patch_cache_control
+from .currency import invalidate_currency_rates
+from .models import CurrencyRate, Product, ReportJob
+from .reports import REPORTS
+from .search import product_search_lookup
+
+
+AUTOFILL_FIELDS = ('id', 'name', 'article_number', 'cost_price', 'brand_id', 'brand__name')
+AUTOFILL_MAX_IDS = 200
+
+AUTOCOMPLETE_PAGE_SIZE = 20
+
+AUTOCOMPLETE_FIELDS = (
+    'id', 'name', 'article_number', 'quantity', 'cost_price', 'brand_id', 'brand__name', 'warehouse__name',
+)
+
+
+def autofill_ids(request, pk=None):
+    if pk is not None:
+        return [pk]
+    ids = {int(value) for value in request.GET.get('ids', '').split(',') if value.strip().isdigit()}
+    return sorted(ids)[:AUTOFILL_MAX_IDS]
+
+
+def autofill_rows(request, pk=None):
+    """Autofill rows of the requested ids: one query per request, shared by the ETag and the view."""
+    if not hasattr(request, '_autofill_rows'):
+        request._autofill_rows = list(
+            Product.objects.filter(pk__in=autofill_ids(request, pk)).order_by('pk').values(*AUTOFILL_FIELDS)
+        )
+    return request._autofill_rows
+
+
+def autofill_etag(request, pk=None):
+    # A digest of the data itself: Product.updated_at does not change when
+    # the brand is renamed.
+    rows = autofill_rows(request, pk)
+    if not rows:
+        return None
+    content = json.dumps([autofill_data(row) | {'id': row['id']} for row in rows], ensure_ascii=False)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def autofill_data(row):
+    return {
+        "name": row['name'],
+        "article_number": row['article_number'],
+        "cost_price": str(row['cost_price'] or ""),
+        "brand_id": row['brand_id'],
+        "brand_name": row['brand__name'],
+    }
+
 
+@condition(etag_func=autofill_etag)
+def product_autofill(request, pk=None):
+    """
+    Autofill data of one product (``/product-autofill/<pk>/``) or of many
+    (``/product-autofill/?ids=1,2,3``, keyed by id), read with one query.
 
-def product_autofill(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    The ETag is a digest of that data, so the browser revalidates with the
+    same single query and gets a 304 when nothing changed.
+    """
+    rows = autofill_rows(request, pk)
+
+    if pk is None:
+        response = JsonResponse({"products": {row['id']: autofill_data(row) for row in rows}})
+    else:
+        row = next(iter(rows), None)
+        if row is None:
+            raise Http404
+        response = JsonResponse(autofill_data(row))
+
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@staff_member_required
+def product_autocomplete(request):
+    """
+    Select2 endpoint for the product inlines: every result carries what the
+    autofill scripts need, read with a single ``values()`` query.
+
+    Search is a single indexed range lookup (see ``product_search_lookup``),
+    and like the admin's own autocomplete it needs the view permission on it.
+    """
+    if not admin.site.get_model_admin(Product).has_view_permission(request):
+        raise PermissionDenied
+
+    term = request.GET.get('term', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    products = Product.objects.all()
+    if term:
+        products = products.filter(product_search_lookup(term))
+
+    offset = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+    rows = list(
+        products.order_by('name', 'pk').values(*AUTOCOMPLETE_FIELDS)[offset:offset + AUTOCOMPLETE_PAGE_SIZE + 1]
+    )
 
     return JsonResponse({
-        "name": product.name,
-        "article_number": product.article_number,
-        "cost_price": str(product.cost_price or ""),
-        "brand_id": product.brand_id,
-        "brand_name": product.brand.name,
+        'results': [
+            {
+                'id': row['id'],
+                'text': Product.label(row['name'], row['article_number'], row['quantity'],
+                                      row['warehouse__name'], row['cost_price']),
+                'name': row['name'],
+                'article_number': row['article_number'],
+                'cost_price': str(row['cost_price'] or ""),
+                'brand_id': row['brand_id'],
+                'brand_name': row['brand__name'],
+            }
+            for row in rows[:AUTOCOMPLETE_PAGE_SIZE]
+        ],
+        'pagination': {'more': len(rows) > AUTOCOMPLETE_PAGE_SIZE},
     })
 
 
-
 @staff_member_required
 @require_POST
 def set_admin_currency(request):
@@ -34,4 +144,22 @@ def set_admin_currency(request):
         currency.selected = True
         currency.save(update_fields=["selected"])
 
-    return JsonResponse({"status": "ok"})
\ No newline at end of file
+    # The update() above sends no signal.
+    invalidate_currency_rates()
+
+    return JsonResponse({"status": "ok"})
+
+
+@staff_member_required
+def report_job_download(request, pk):
+    """The file of a finished report, for its author or whoever may view all reports."""
+    jobs = ReportJob.objects.filter(status='done')
+    if not request.user.has_perm('main.view_reportjob'):
+        jobs = jobs.filter(created_by=request.user)
+    job = get_object_or_404(jobs, pk=pk)
+
+    return FileResponse(
+        job.result.open('rb'),
+        as_attachment=True,
+        filename=REPORTS[job.kind][2],
+    )
@@ -0,0 +1,23 @@
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.urls import reverse
+
+
+class ProductAutocompleteSelect(AutocompleteSelect):
+    """
+    Admin autocomplete served by ``product_autocomplete``, whose results
+    already carry the autofill data of the product.
+    """
+
+    def get_url(self):
+        return reverse('product_autocomplete')
+
+
+class ProductAutocompleteMixin:
+    """Inline mixin rendering the ``product`` foreign key with ProductAutocompleteSelect."""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            kwargs['widget'] = ProductAutocompleteSelect(db_field, self.admin_site)
+            # Labels of the already selected products need their warehouse.
+            kwargs['queryset'] = db_field.related_model.objects.select_related('warehouse')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
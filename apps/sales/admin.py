@@ -1,33 +1,32 @@
-from django.contrib import admin
-from django.http import HttpResponse
-from rangefilter.filters import DateRangeFilterBuilder
-
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-
-from .models import Sale, SaleItem, Client, Payment
-from apps.main.utils import convert_from_usd, parse_admin_date
-
-
-@admin.action(description='Экспорт выбранных товаров продажи в Excel')
-def export_sale_items_to_excel(modeladmin, request, queryset):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Товары продажи"
-
-    bold = Font(bold=True)
-    center = Alignment(horizontal='center')
-    left = Alignment(horizontal='left')
-
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin'),
-    )
-
-    # ================= DATE RANGE =================
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.contrib import admin, messages
+from django import forms
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import F
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from rangefilter.filters import DateRangeFilterBuilder, NumericRangeFilterBuilder
+
+from .models import Sale, SaleItem, Client, Payment, BalanceEntry
+from .analytics import sales_dashboard
+from .balances import statement
+from .exports import sale_items_report
+from .forms import SalesDashboardForm, StatementForm
+from apps.main.utils import format_currency, parse_admin_date
+from apps.main.reports import queue_report_action
+from apps.main.pagination import KeysetPaginationMixin
+from apps.main.search import ArticleSearchMixin
+from apps.main.widgets import ProductAutocompleteMixin
+from apps.main.models import Product
+from apps.main.stock import InsufficientStock
+
+
+def sale_date_range_text(request):
     start = request.GET.get('sale__sale_date__range__gte')
     end = request.GET.get('sale__sale_date__range__lte')
 
@@ -40,87 +39,70 @@ def export_sale_items_to_excel(modeladmin, request, queryset):
     else:
         date_range_text += "за всё время"
 
-    # ================= TOTAL AMOUNT =================
-    total_amount = sum(item.total_cost for item in queryset)
-
-    # ================= TOP INFO =================
-    ws.merge_cells('D1:H1')
-    ws['D1'] = date_range_text
-    ws['D1'].font = bold
-    ws['D1'].alignment = left
-
-    ws.merge_cells('D2:H2')
-    ws['D2'] = f"Общая сумма продаж: {total_amount}"
-    ws['D2'].font = bold
-    ws['D2'].alignment = left
-
-    # ================= HEADERS =================
-    headers = [
-        "Продажа ID",
-        "Дата продажи",
-        "Клиент",
-        "Товар",
-        "Артикул",
-        "Количество",
-        "Цена продажи",
-        "Сумма",
-    ]
-
-    ws.append([])
-    ws.append(headers)
-
-    header_row = ws.max_row
-
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = bold
-        cell.alignment = center
-        cell.border = thin_border
-
-    # ================= DATA =================
-    for item in queryset.select_related('sale', 'sale__client', 'product'):
-        ws.append([
-            item.sale.id,
-            item.sale.sale_date.strftime('%Y-%m-%d %H:%M'),
-            item.sale.client.full_name,
-            item.product.name,
-            getattr(item.product, 'article_number', ''),
-            item.quantity,
-            float(item.sale_price),
-            float(item.total_cost),
-        ])
-
-    # ================= STYLING BODY =================
-    for row in ws.iter_rows(min_row=header_row + 1, max_row=ws.max_row):
-        for cell in row:
-            cell.border = thin_border
-            cell.alignment = left if cell.column in [3, 4] else center
-
-    # ================= AUTO WIDTH =================
-    for column_cells in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(column_cells[0].column)
-
-        for cell in column_cells:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    # ================= RESPONSE =================
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="sale_items.xlsx"'
-    wb.save(response)
-
-    return response
+    return date_range_text
 
 
-class SaleItemInline(admin.TabularInline):
+@admin.action(description='Экспорт выбранных товаров продажи в Excel')
+def export_sale_items_to_excel(modeladmin, request, queryset):
+    report = sale_items_report(queryset, sale_date_range_text(request))
+    return report.response("sale_items.xlsx")
+
+
+@admin.action(description='Экспорт выбранных товаров продажи в Excel (в фоне)')
+def export_sale_items_in_background(modeladmin, request, queryset):
+    queue_report_action(modeladmin, request, 'sale_items', queryset, sale_date_range_text(request))
+
+
+class InsufficientStockMixin:
+    """
+    Handle a sale that lost the race for the last units of a product to a
+    concurrent one between validation and save. The whole save has been
+    rolled back by then, so the view runs once more: the stock checks of
+    the forms now see the new stock and show the form again with the
+    error and everything entered. Should the sale fail again, it ends
+    with an error message.
+    """
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        for attempt in range(2):
+            try:
+                return super().changeform_view(request, object_id, form_url, extra_context)
+            except InsufficientStock as error:
+                failure = error
+        self.message_user(request, str(failure), messages.ERROR)
+        return HttpResponseRedirect(request.get_full_path())
+
+
+class SaleItemFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        """
+        Check the new lines against the stock, summed per product: each
+        line alone may fit while together they take more than is left.
+        """
+        super().clean()
+        wanted = defaultdict(int)
+        for form in self.forms:
+            if form.instance.pk or not getattr(form, 'cleaned_data', None) or form.cleaned_data.get('DELETE'):
+                continue
+            product, quantity = form.cleaned_data.get('product'), form.cleaned_data.get('quantity')
+            if product and quantity:
+                wanted[product.pk] += quantity
+
+        in_stock = Product.objects.filter(pk__in=wanted).in_bulk()
+        errors = [
+            f"Недостаточно товара «{in_stock[pk].name}»: на складе {in_stock[pk].quantity} шт., "
+            f"в продаже {quantity} шт."
+            for pk, quantity in wanted.items()
+            if pk in in_stock and in_stock[pk].quantity < quantity
+        ]
+        if errors:
+            raise ValidationError(errors)
+
+
+class SaleItemInline(ProductAutocompleteMixin, admin.TabularInline):
     model = SaleItem
+    formset = SaleItemFormSet
     extra = 1
-    autocomplete_fields = ('product',)
     readonly_fields = ('row_total',)
     can_delete = False
     fields = (
@@ -135,6 +117,10 @@ class SaleItemInline(admin.TabularInline):
         return "—"
     row_total.short_description = "Итого"
 
+    def get_queryset(self, request):
+        # Tabular inlines print str(item), which reads its product and sale.
+        return super().get_queryset(request).select_related('product', 'sale')
+
     class Media:
         js = ("admin/js/inline_row_numbers.js",)
         css = {
@@ -158,33 +144,72 @@ class SaleItemInline(admin.TabularInline):
 
  
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
-    list_display = ('id', 'sale_date', 'client__full_name', 'total_amount')
+class SaleAdmin(InsufficientStockMixin, admin.ModelAdmin):
+    list_display = ('id', 'sale_date', 'client__full_name', 'total_amount_converted')
     list_display_links = ('id', 'sale_date')
-    list_filter = ('sale_date', 'client__full_name')
+    list_filter = ('sale_date', 'client__full_name', ('total_amount', NumericRangeFilterBuilder()))
     search_fields = ('id', 'client__full_name')
     inlines = [SaleItemInline]
     autocomplete_fields = ('client',)
 
-    @admin.display(description='Общая сумма')
-    def total_amount(self, obj):
-        return convert_from_usd(obj.total_amount)
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_converted(converted_total_amount='total_amount')
+
+    @admin.display(description='Общая сумма', ordering='total_amount')
+    def total_amount_converted(self, obj):
+        return format_currency(obj.converted_total_amount)
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='sales_sale_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Sales analytics for a date range, served from the daily sales rollups."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        today = timezone.localdate()
+        form = SalesDashboardForm(request.GET or {'start': today.replace(day=1), 'end': today, 'period': 'day'})
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Аналитика продаж",
+            'opts': self.model._meta,
+            'form': form,
+            'dashboard': None,
+        }
+
+        if form.is_valid():
+            context['dashboard'] = sales_dashboard(
+                form.cleaned_data['start'], form.cleaned_data['end'], form.cleaned_data['period'],
+            )
+
+        return render(request, 'admin/sales/sale/dashboard.html', context)
     
     class Media:
         js = (
             'admin/js/inline_totals.js',
             'admin/js/sale_inline_keyboard_nav.js',
+            "admin/js/product_autofill_loader.js",
             "admin/js/sale_product_autofill.js",
         )
 
 
 @admin.register(SaleItem)
-class SaleItemAdmin(admin.ModelAdmin):
+class SaleItemAdmin(KeysetPaginationMixin, ArticleSearchMixin, InsufficientStockMixin, admin.ModelAdmin):
     list_display = ('sale__id', 'product__name', 'show_quantity', 'sale_price_converted', 'total_cost', 'sale_date')
     list_display_links = ('sale__id', 'product__name')
     search_fields = ('sale__id', 'product__name', 'product__article_number')
+    article_key_field = 'product__article_key'
+    list_select_related = ('sale', 'product')
     list_filter = (('sale__sale_date', DateRangeFilterBuilder()),  'product__brand__name')
-    actions = (export_sale_items_to_excel,)
+    actions = (export_sale_items_to_excel, export_sale_items_in_background)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_converted(
+            converted_sale_price='sale_price',
+            converted_total_cost=F('quantity') * F('sale_price'),
+        )
 
     @admin.display(description='Дата продажи')
     def sale_date(self, obj):
@@ -194,20 +219,81 @@ class SaleItemAdmin(admin.ModelAdmin):
     def show_quantity(self, obj):
         return f"{obj.quantity} шт."
 
-    @admin.display(description='Цена продажи')
+    @admin.display(description='Цена продажи', ordering='converted_sale_price')
     def sale_price_converted(self, obj):
-        return convert_from_usd(obj.sale_price)
+        return format_currency(obj.converted_sale_price)
 
-    @admin.display(description='Итоговая стоимость')
+    @admin.display(description='Итоговая стоимость', ordering='converted_total_cost')
     def total_cost(self, obj):
-        return convert_from_usd(obj.total_cost)
+        return format_currency(obj.converted_total_cost)
 
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ('full_name', 'phone_number', 'balance', 'address')
+    list_display = ('full_name', 'phone_number', 'balance', 'address', 'statement_link')
     search_fields = ('full_name', 'phone_number')
 
+    def get_readonly_fields(self, request, obj=None):
+        # Only the opening balance is entered by hand, later changes come
+        # from sales and payments through the balance journal.
+        if obj:
+            return ('balance',)
+        return ()
+
+    @admin.display(description='Выписка')
+    def statement_link(self, obj):
+        return format_html('<a href="{}">Выписка</a>', reverse('admin:sales_client_statement', args=[obj.pk]))
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/statement/', self.admin_site.admin_view(self.statement_view),
+                 name='sales_client_statement'),
+        ] + super().get_urls()
+
+    def statement_view(self, request, pk):
+        """Balance journal of a client for a date range, with opening and closing balances."""
+        client = get_object_or_404(Client, pk=pk)
+        if not self.has_view_permission(request, client):
+            raise PermissionDenied
+
+        today = timezone.localdate()
+        form = StatementForm(request.GET or {'start': today.replace(day=1), 'end': today})
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f"Выписка: {client.full_name}",
+            'opts': self.model._meta,
+            'client': client,
+            'form': form,
+            'entries': None,
+        }
+
+        if form.is_valid():
+            context.update(statement(
+                client.pk,
+                timezone.make_aware(datetime.combine(form.cleaned_data['start'], time.min)),
+                timezone.make_aware(datetime.combine(form.cleaned_data['end'], time.max)),
+            ))
+
+        return render(request, 'admin/sales/client/statement.html', context)
+
+
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'client', 'kind', 'amount', 'balance_after', 'sale', 'payment')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('client__full_name', 'client__phone_number')
+    list_select_related = ('client', 'sale__client', 'payment__client')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
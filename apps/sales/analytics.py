@@ -0,0 +1,68 @@
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from apps.main.currency import converted
+
+from .models import ClientSalesDay, ProductSalesDay
+
+
+PERIODS = (
+    ('day', 'По дням'),
+    ('week', 'По неделям'),
+    ('month', 'По месяцам'),
+)
+
+PERIOD_TRUNCS = {
+    'day': F('day'),
+    'week': TruncWeek('day'),
+    'month': TruncMonth('day'),
+}
+
+
+def sales_sums():
+    return {
+        'quantity': Sum('quantity', default=0),
+        'revenue': converted(Sum('revenue', default=0)),
+        'cost': converted(Sum('cost', default=0)),
+    }
+
+
+def with_margin(rows):
+    """
+    Add the margin, margin percentage and bar width (revenue relative to
+    the best row, in percent) to aggregated rows.
+    """
+    rows = list(rows)
+    best = max((row['revenue'] for row in rows), default=0)
+    for row in rows:
+        row['margin'] = row['revenue'] - row['cost']
+        row['margin_percent'] = round(row['margin'] * 100 / row['revenue'], 1) if row['revenue'] else None
+        row['bar'] = int(max(row['revenue'], 0) * 100 / best) if best > 0 else 0
+    return rows
+
+
+def sales_dashboard(start, end, period='day', limit=20):
+    """
+    Revenue, cost of goods, margin and units sold between ``start`` and
+    ``end`` (dates, inclusive), read only from the daily sales rollups:
+    totals, a timeline by ``period`` and the best brands, warehouses,
+    clients and products.
+    """
+    products = ProductSalesDay.objects.filter(day__range=(start, end))
+    clients = ClientSalesDay.objects.filter(day__range=(start, end))
+
+    def best(queryset, *fields, **names):
+        return with_margin(
+            queryset.values(*fields, **names).annotate(**sales_sums()).order_by('-revenue')[:limit]
+        )
+
+    return {
+        'totals': with_margin([clients.aggregate(**sales_sums())])[0],
+        'timeline': with_margin(
+            clients.annotate(period=PERIOD_TRUNCS[period]).values('period').annotate(**sales_sums()).order_by('period')
+        ),
+        'brands': best(products, name=F('product__brand__name')),
+        'warehouses': best(products, name=F('product__warehouse__name')),
+        'clients': best(clients, 'client', name=F('client__full_name')),
+        'products': best(products, 'product', name=F('product__name')),
+    }
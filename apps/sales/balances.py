@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import BalanceCheckpoint, BalanceEntry, Client
+
+
+# Entries are dated by their document (sale or payment date), which may be
+# earlier than entries already posted. ``balance_after`` is the running
+# balance in journal order, (created_at, pk), and checkpoints hold the sum
+# of the entries dated up to them: an entry dated in the past shifts both.
+
+def later_entries(client_id, moment, pk=None):
+    """Entries of the client after ``moment`` (or after the entry ``pk`` dated ``moment``) in journal order."""
+    after = Q(created_at__gt=moment)
+    if pk is not None:
+        after |= Q(created_at=moment, pk__gt=pk)
+    return BalanceEntry.objects.filter(after, client_id=client_id)
+
+
+def shift_balances(client_id, amount, moment, pk=None):
+    """Add ``amount`` to the running balances after ``moment`` and the checkpoints taken since."""
+    later_entries(client_id, moment, pk).update(balance_after=F('balance_after') + amount)
+    BalanceCheckpoint.objects.filter(client_id=client_id, taken_at__gte=moment).update(
+        balance=F('balance') + amount
+    )
+
+
+def running_balance(client_id, moment, pk=None):
+    """
+    Running balance of an entry dated ``moment``: the client's balance less
+    the entries after it, one index range read.
+    """
+    balance = Client.objects.values_list('balance', flat=True).get(pk=client_id)
+    return balance - later_entries(client_id, moment, pk).aggregate(total=Sum('amount', default=0))['total']
+
+
+@transaction.atomic
+def post_balance(client_id, amount, kind, moment=None, **links):
+    """
+    Add ``amount`` to the client's balance and journal it, dated ``moment``
+    (the date of its document) or now.
+
+    The UPDATE keeps the client row locked until the transaction ends, so
+    the running balances stay consistent even with concurrent writers.
+    """
+    if not amount:
+        return
+    if moment is None:
+        moment = timezone.now()
+
+    Client.objects.filter(pk=client_id).update(balance=F('balance') + amount)
+    shift_balances(client_id, amount, moment)
+    BalanceEntry.objects.create(
+        client_id=client_id, kind=kind, amount=amount, created_at=moment,
+        balance_after=running_balance(client_id, moment), **links,
+    )
+
+
+@transaction.atomic
+def redate_balance_entries(entries, moment):
+    """Move ``entries`` (a BalanceEntry queryset) to ``moment`` when the date of their document changes."""
+    for entry in entries.order_by('created_at', 'pk'):
+        # Lock the client, as post_balance does.
+        Client.objects.select_for_update().filter(pk=entry.client_id).exists()
+        shift_balances(entry.client_id, -entry.amount, entry.created_at, entry.pk)
+        BalanceEntry.objects.filter(pk=entry.pk).update(created_at=moment)
+        shift_balances(entry.client_id, entry.amount, moment, entry.pk)
+        BalanceEntry.objects.filter(pk=entry.pk).update(
+            balance_after=running_balance(entry.client_id, moment, entry.pk),
+        )
+
+
+def balance_at(client_id, moment):
+    """
+    Balance of the client at ``moment``: the running balance of the last
+    journal entry or checkpoint up to it, each found with one index seek.
+    """
+    entry = BalanceEntry.objects.filter(client_id=client_id, created_at__lte=moment).order_by(
+        '-created_at', '-pk'
+    ).values_list('created_at', 'balance_after').first()
+    checkpoint = BalanceCheckpoint.objects.filter(client_id=client_id, taken_at__lte=moment).order_by(
+        '-taken_at'
+    ).values_list('taken_at', 'balance').first()
+
+    known = max(filter(None, (entry, checkpoint)), key=lambda row: row[0], default=None)
+    if known is not None:
+        return known[1]
+
+    # Before the first entry: undo the first entry after ``moment``.
+    first = BalanceEntry.objects.filter(client_id=client_id, created_at__gt=moment).order_by(
+        'created_at', 'pk'
+    ).values_list('balance_after', 'amount').first()
+    if first is not None:
+        return first[0] - first[1]
+
+    return Client.objects.values_list('balance', flat=True).get(pk=client_id)
+
+
+def statement(client_id, start, end):
+    """Opening balance, journal entries and closing balance of ``[start, end]``."""
+    return {
+        'opening_balance': balance_at(client_id, start),
+        'entries': BalanceEntry.objects.filter(
+            client_id=client_id, created_at__gte=start, created_at__lte=end
+        ).select_related('sale', 'payment').order_by('created_at', 'pk'),
+        'closing_balance': balance_at(client_id, end),
+    }
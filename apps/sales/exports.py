@@ -0,0 +1,99 @@
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Window
+
+from apps.main.currency import converted
+from apps.main.excel import StreamingSheet, LEFT, CENTER, HEADER, CHUNK_SIZE, widest_values, column_widths
+from apps.main.utils import format_currency
+
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+SALE_ITEM_COLUMNS = (
+    ("Продажа ID", 'sale_id', CENTER),
+    ("Дата продажи", 'sale__sale_date', CENTER),
+    ("Клиент", 'sale__client__full_name', LEFT),
+    ("Товар", 'product__name', LEFT),
+    ("Артикул", 'product__article_number', CENTER),
+    ("Количество", 'quantity', CENTER),
+    ("Цена продажи", 'sale_price', CENTER),
+    ("Сумма", 'line_total', CENTER),
+)
+SALE_ITEM_NUMBER_FIELDS = ('sale_id', 'quantity', 'sale_price', 'line_total')
+SALE_ITEM_FIXED_LENGTHS = {'sale__sale_date': len('YYYY-MM-DD HH:MM')}
+
+
+def sale_items_report(queryset, date_range_text, progress=None):
+    """
+    Sale lines of ``queryset`` grouped by sale, each sale closed by its subtotal.
+
+    The grand total and column widths come from one aggregate query. Rows
+    are read in a single pass ordered by sale; the per-sale subtotal is a
+    window sum computed by the database next to each row.
+    ``progress(done, total)`` is called after every chunk of rows.
+    """
+    queryset = queryset.annotate(
+        line_total=ExpressionWrapper(
+            F('quantity') * F('sale_price'),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+    )
+    headers = [header for header, _, _ in SALE_ITEM_COLUMNS]
+    fields = [field for _, field, _ in SALE_ITEM_COLUMNS]
+    styles = [style for _, _, style in SALE_ITEM_COLUMNS]
+
+    totals = queryset.aggregate(
+        total_rows=Count('pk'),
+        total_amount=Sum('line_total', default=0),
+        total_amount_converted=converted(Sum(F('quantity') * F('sale_price'), default=0)),
+        **widest_values(SALE_ITEM_COLUMNS, SALE_ITEM_NUMBER_FIELDS, SALE_ITEM_FIXED_LENGTHS),
+    )
+
+    sheet = StreamingSheet("Товары продажи", column_widths(
+        SALE_ITEM_COLUMNS, SALE_ITEM_NUMBER_FIELDS, totals, SALE_ITEM_FIXED_LENGTHS
+    ))
+
+    sheet.title(date_range_text)
+    sheet.title(
+        f"Общая сумма продаж: {totals['total_amount']:.2f} | "
+        f"{format_currency(totals['total_amount_converted'])}"
+    )
+
+    sheet.append([])
+    sheet.header(headers)
+
+    rows = queryset.annotate(
+        sale_total=Window(Sum('line_total'), partition_by=F('sale_id')),
+    ).order_by('sale__sale_date', 'sale_id', 'pk').values_list(*fields, 'sale_total')
+
+    current_sale, current_total = None, None
+    for index, (sale_id, sale_date, client, product, article_number, quantity, sale_price, line_total,
+                sale_total) in enumerate(rows.iterator(chunk_size=CHUNK_SIZE), start=1):
+        if current_sale is not None and sale_id != current_sale:
+            sale_subtotal(sheet, current_total)
+        current_sale, current_total = sale_id, sale_total
+
+        sheet.append([
+            sale_id,
+            sale_date.strftime(DATE_FORMAT),
+            client,
+            product,
+            article_number or '',
+            quantity,
+            float(sale_price),
+            float(line_total),
+        ], styles)
+
+        if progress and index % CHUNK_SIZE == 0:
+            progress(index, totals['total_rows'])
+
+    if current_sale is not None:
+        sale_subtotal(sheet, current_total)
+
+    return sheet
+
+
+def sale_subtotal(sheet, total):
+    columns = len(SALE_ITEM_COLUMNS)
+    sheet.append(
+        [''] * (columns - 2) + ["Итого:", float(total)],
+        [CENTER] * (columns - 2) + [HEADER, HEADER],
+    )
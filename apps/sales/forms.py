@@ -0,0 +1,18 @@
+from django import forms
+
+from .analytics import PERIODS
+
+
+class StatementForm(forms.Form):
+    start = forms.DateField(label="С", widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(label="По", widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('start') and cleaned_data.get('end') and cleaned_data['start'] > cleaned_data['end']:
+            raise forms.ValidationError("Начало периода позже его конца")
+        return cleaned_data
+
+
+class SalesDashboardForm(StatementForm):
+    period = forms.ChoiceField(label="Группировка", choices=PERIODS, initial='day')
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.main.excel import CHUNK_SIZE
+from apps.sales.models import BalanceCheckpoint, BalanceEntry, Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Record every client's balance as a BalanceCheckpoint and report clients whose "
+        "balance does not match the running balance of their last journal entry. "
+        "Run it periodically (e.g. monthly from cron)."
+    )
+
+    def handle(self, *args, **options):
+        taken_at = timezone.now()
+        created = 0
+
+        # Entries dated later than now (post-dated sales) belong to the
+        # checkpoints after their date.
+        later = BalanceEntry.objects.filter(client=OuterRef('pk'), created_at__gt=taken_at).order_by().values(
+            'client'
+        ).annotate(total=Sum('amount')).values('total')
+        balances = Client.objects.annotate(
+            balance_then=F('balance') - Coalesce(Subquery(later), 0, output_field=DecimalField()),
+        ).values_list('pk', 'balance_then')
+
+        with transaction.atomic():
+            batch = []
+            for client_id, balance in balances.iterator(CHUNK_SIZE):
+                batch.append(BalanceCheckpoint(client_id=client_id, balance=balance, taken_at=taken_at))
+                if len(batch) == CHUNK_SIZE:
+                    created += len(BalanceCheckpoint.objects.bulk_create(batch))
+                    batch = []
+            created += len(BalanceCheckpoint.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {created} balance checkpoints at {taken_at:%Y-%m-%d %H:%M}."
+        ))
+
+        last_entries = BalanceEntry.objects.filter(client=OuterRef('pk')).order_by('-created_at', '-pk')
+        drifted = Client.objects.annotate(
+            journal_balance=Subquery(last_entries.values('balance_after')[:1])
+        ).filter(journal_balance__isnull=False).exclude(balance=F('journal_balance'))
+
+        for client in drifted:
+            self.stdout.write(self.style.WARNING(
+                f"{client}: balance {client.balance}, journal {client.journal_balance}"
+            ))
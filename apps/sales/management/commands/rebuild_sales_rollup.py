@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.main.excel import CHUNK_SIZE
+from apps.main.models import Product
+from apps.sales.models import ClientSalesDay, ProductSalesDay, SaleItem
+
+
+def daily_sales(key):
+    """Sale lines summed per ``key`` (a SaleItem lookup) and local day of the sale."""
+    return (
+        SaleItem.objects
+        .annotate(day=TruncDate('sale__sale_date', tzinfo=timezone.get_current_timezone()))
+        .values_list(key, 'day')
+        .annotate(
+            sold=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('sale_price')),
+            cost=Sum(F('quantity') * Coalesce('cost_price', Value(0, output_field=DecimalField()))),
+        )
+        .order_by()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily sales rollups (ProductSalesDay, ClientSalesDay) from the sale lines. "
+        "The sale signals keep them current; run this after importing data or when the "
+        "sold quantities in the product list or the sales dashboard look wrong."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fill-costs', action='store_true',
+                            help="First give sale lines without a cost the current cost of their product.")
+
+    def handle(self, *args, fill_costs, **options):
+        with transaction.atomic():
+            if fill_costs:
+                filled = SaleItem.objects.filter(cost_price__isnull=True).update(
+                    cost_price=Subquery(Product.objects.filter(pk=OuterRef('product')).values('cost_price')[:1])
+                )
+                self.stdout.write(f"Filled the cost of {filled} sale lines.")
+
+            for model, key in ((ProductSalesDay, 'product'), (ClientSalesDay, 'sale__client')):
+                model.objects.all().delete()
+                field = model._meta.get_field(key.split('__')[-1]).attname
+
+                created, batch = 0, []
+                for key_id, day, quantity, revenue, cost in daily_sales(key).iterator(CHUNK_SIZE):
+                    batch.append(model(**{field: key_id}, day=day, quantity=quantity, revenue=revenue, cost=cost))
+                    if len(batch) == CHUNK_SIZE:
+                        created += len(model.objects.bulk_create(batch))
+                        batch = []
+                created += len(model.objects.bulk_create(batch))
+
+                self.stdout.write(f"Rebuilt {created} rows of {model._meta.verbose_name_plural}.")
+
+        self.stdout.write(self.style.SUCCESS("Sales rollups rebuilt."))
@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.main.models import Arrival, ArrivalProduct
+from apps.sales.models import Sale, SaleItem
+
+
+def items_total(items, document_field, price_field):
+    """Correlated subquery summing quantity * price of a document's items."""
+    return Coalesce(
+        Subquery(
+            items.filter(**{document_field: OuterRef('pk')})
+            .order_by()
+            .values(document_field)
+            .annotate(total=Sum(F('quantity') * F(price_field)))
+            .values('total')
+        ),
+        Value(Decimal('0')),
+    )
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored total_amount of every Arrival and Sale from their items."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            arrivals = Arrival.objects.update(
+                total_amount=items_total(ArrivalProduct.objects.all(), 'arrival', 'cost_price')
+            )
+            sales = Sale.objects.update(
+                total_amount=items_total(SaleItem.objects.all(), 'sale', 'sale_price')
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt totals of {arrivals} arrivals and {sales} sales."
+        ))
@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=50, verbose_name='ФИО')),
+                ('phone_number', models.CharField(max_length=20, verbose_name='Номер телефона')),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='Баланс')),
+                ('address', models.CharField(blank=True, max_length=255, null=True, verbose_name='Адрес')),
+            ],
+            options={
+                'verbose_name': 'Клиент',
+                'verbose_name_plural': 'Клиенты',
+            },
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('payment_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата платежа')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='sales.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Платеж',
+                'verbose_name_plural': 'Платежи',
+            },
+        ),
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Общая сумма')),
+                ('sale_date', models.DateTimeField(verbose_name='Дата продажи')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='sales.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Продажа',
+                'verbose_name_plural': 'Продажи',
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('sale_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена продажи')),
+                ('article_number', models.CharField(blank=True, max_length=50, null=True, verbose_name='Артикул')),
+                ('cost_price', models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Себестоимость')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='sale_items', to='main.product', verbose_name='Товар')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='items', to='sales.sale', verbose_name='Продажа')),
+            ],
+            options={
+                'verbose_name': 'Товар продажи',
+                'verbose_name_plural': 'Товары продаж',
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Баланс')),
+                ('taken_at', models.DateTimeField(verbose_name='Время')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='sales.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка баланса',
+                'verbose_name_plural': 'Контрольные точки баланса',
+                'indexes': [models.Index(fields=['client', 'taken_at'], name='balance_checkpoint_client_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientSalesDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Продано')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Себестоимость')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='sales.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Продажи клиенту за день',
+                'verbose_name_plural': 'Продажи клиентам по дням',
+                'indexes': [models.Index(fields=['day'], name='client_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('client', 'day'), name='client_sales_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Продано')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Себестоимость')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='main.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи товаров по дням',
+                'indexes': [models.Index(fields=['day'], name='product_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='product_sales_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный баланс'), ('sale', 'Продажа'), ('return', 'Возврат'), ('payment', 'Платеж'), ('payment_cancel', 'Отмена платежа')], max_length=15, verbose_name='Тип')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Баланс после')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to='sales.client', verbose_name='Клиент')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_entries', to='sales.payment', verbose_name='Платеж')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_entries', to='sales.sale', verbose_name='Продажа')),
+            ],
+            options={
+                'verbose_name': 'Запись баланса',
+                'verbose_name_plural': 'Журнал баланса',
+                'indexes': [models.Index(fields=['client', 'created_at'], name='balance_entry_client_idx')],
+            },
+        ),
+    ]
@@ -1,15 +1,17 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
+from apps.main.managers import ConvertedQuerySet
+from apps.main.models import StoredFieldsModel, StoredTotalModel
 
-class Sale(models.Model):
+
+class Sale(StoredTotalModel):
     sale_date = models.DateTimeField(verbose_name="Дата продажи")
     client = models.ForeignKey('sales.Client', on_delete=models.PROTECT, related_name='purchases', verbose_name="Клиент")
     # warehouse = models.ForeignKey('main.Warehouse', on_delete=models.PROTECT, related_name='purchases', verbose_name='Продажа из склада')
 
-    @property
-    def total_amount(self):
-        return sum(item.quantity * item.sale_price for item in self.items.all())
+    objects = ConvertedQuerySet.as_manager()
 
     def __str__(self):
         return f"Продажа {self.id} клиенту {self.client.full_name} на {self.sale_date}"
@@ -25,6 +27,11 @@ class SaleItem(models.Model):
     quantity = models.PositiveIntegerField(verbose_name="Количество")
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена продажи")
     article_number = models.CharField(max_length=50, verbose_name="Артикул", null=True, blank=True)
+    # Unit cost of the product when it was sold, for margins.
+    cost_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False,
+                                     verbose_name="Себестоимость")
+
+    objects = ConvertedQuerySet.as_manager()
 
     @property
     def total_cost(self): 
@@ -35,11 +42,14 @@ class SaleItem(models.Model):
     def clean(self):
         if self.pk:
             old = SaleItem.objects.get(pk=self.pk)
-            delta = self.quantity - old.quantity
+            delta = self.quantity - old.quantity if old.product_id == self.product_id else self.quantity
         else:
             delta = self.quantity
 
-        if self.product.quantity < delta:
+        # Early, friendly check against the current stock. The sale itself is
+        # guarded by the conditional update in apps.main.stock.take_from_stock.
+        in_stock = type(self.product).objects.filter(pk=self.product_id).values_list('quantity', flat=True).first()
+        if (in_stock or 0) < delta:
             raise ValidationError("Недостаточно товара на складе")
         
         # if self.sale.warehouse != self.product.warehouse:
@@ -54,12 +64,15 @@ class SaleItem(models.Model):
         verbose_name_plural = "Товары продаж"
 
 
-class Client(models.Model):
+class Client(StoredFieldsModel):
     full_name = models.CharField(max_length=50, verbose_name="ФИО")
     phone_number = models.CharField(max_length=20, verbose_name="Номер телефона")
     balance = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Баланс", default=0.00)
     address = models.CharField(max_length=255, verbose_name="Адрес", blank=True, null=True)
 
+    # The balance is a projection of the BalanceEntry journal.
+    stored_fields = ('balance',)
+
     def __str__(self):
         return f"{self.full_name} {self.phone_number}"
     
@@ -78,4 +91,100 @@ class Payment(models.Model):
     
     class Meta:
         verbose_name = "Платеж"
-        verbose_name_plural = "Платежи"
\ No newline at end of file
+        verbose_name_plural = "Платежи"
+
+
+class BalanceEntry(models.Model):
+    """
+    Journal of client balance changes, dated by their sale or payment.
+    ``balance_after`` is the running balance in journal order (created_at,
+    pk), so Client.balance always equals that of the client's last entry.
+    """
+    KINDS = (
+        ('opening', 'Начальный баланс'),
+        ('sale', 'Продажа'),
+        ('return', 'Возврат'),
+        ('payment', 'Платеж'),
+        ('payment_cancel', 'Отмена платежа'),
+    )
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='balance_entries',
+                               verbose_name="Клиент")
+    kind = models.CharField(max_length=15, choices=KINDS, verbose_name="Тип")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Баланс после")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Время")
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='balance_entries', verbose_name="Продажа")
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='balance_entries', verbose_name="Платеж")
+
+    def __str__(self):
+        return f"{self.client.full_name}: {self.amount:+} ({self.get_kind_display()})"
+
+    class Meta:
+        verbose_name = "Запись баланса"
+        verbose_name_plural = "Журнал баланса"
+        indexes = [models.Index(fields=['client', 'created_at'], name='balance_entry_client_idx')]
+
+
+class BalanceCheckpoint(models.Model):
+    """Client balance at ``taken_at``, the starting point for statements."""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='balance_checkpoints',
+                               verbose_name="Клиент")
+    balance = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Баланс")
+    taken_at = models.DateTimeField(verbose_name="Время")
+
+    def __str__(self):
+        return f"{self.client.full_name}: {self.balance} на {self.taken_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        verbose_name = "Контрольная точка баланса"
+        verbose_name_plural = "Контрольные точки баланса"
+        indexes = [models.Index(fields=['client', 'taken_at'], name='balance_checkpoint_client_idx')]
+
+
+class SalesDay(models.Model):
+    """
+    Sales of one day (local date of the sale), kept up to date by the sale
+    signals and rebuilt by ``rebuild_sales_rollup``. Amounts are in USD.
+    """
+    day = models.DateField(verbose_name="День")
+    quantity = models.IntegerField(default=0, verbose_name="Продано")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Себестоимость")
+
+    class Meta:
+        abstract = True
+
+
+class ProductSalesDay(SalesDay):
+    product = models.ForeignKey('main.Product', on_delete=models.CASCADE, related_name='sales_days',
+                                verbose_name="Товар")
+
+    def __str__(self):
+        return f"{self.product.name}: {self.quantity} шт. {self.day}"
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='product_sales_day_unique'),
+        ]
+        indexes = [models.Index(fields=['day'], name='product_sales_day_idx')]
+
+
+class ClientSalesDay(SalesDay):
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='sales_days',
+                               verbose_name="Клиент")
+
+    def __str__(self):
+        return f"{self.client.full_name}: {self.revenue} {self.day}"
+
+    class Meta:
+        verbose_name = "Продажи клиенту за день"
+        verbose_name_plural = "Продажи клиентам по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'day'], name='client_sales_day_unique'),
+        ]
+        indexes = [models.Index(fields=['day'], name='client_sales_day_idx')]
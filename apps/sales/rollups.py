@@ -0,0 +1,45 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ClientSalesDay, ProductSalesDay
+
+
+ROLLUP_FIELDS = ('quantity', 'revenue', 'cost')
+
+
+def sale_day(sale_date):
+    return timezone.localdate(sale_date)
+
+
+def line_totals(quantity, sale_price, cost_price):
+    """(quantity, revenue, cost) of a sale line, as added to the rollups."""
+    return quantity, quantity * sale_price, quantity * (cost_price or 0)
+
+
+def add_to_rollup(model, key, totals):
+    """Add ``totals`` (negative for returns) to the row of ``model`` for ``key``."""
+    if not any(totals):
+        return
+
+    rows = model.objects.filter(**key)
+    increments = {field: F(field) + value for field, value in zip(ROLLUP_FIELDS, totals)}
+    if rows.update(**increments):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **dict(zip(ROLLUP_FIELDS, totals)))
+    except IntegrityError:
+        # Created by a concurrent sale in between.
+        rows.update(**increments)
+
+
+def post_sales(day, client_id, product_id, totals):
+    """Add a change in sales to the product and client daily rollups."""
+    add_to_rollup(ProductSalesDay, {'product_id': product_id, 'day': day}, totals)
+    add_to_rollup(ClientSalesDay, {'client_id': client_id, 'day': day}, totals)
+
+
+def negated(totals):
+    return tuple(-value for value in totals)
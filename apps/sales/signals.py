@@ -1,52 +1,125 @@
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 
-from .models import SaleItem, Payment
+from apps.main.models import Product
+from apps.main.models import StockMovement
+from apps.main.stock import move_stock, redate_movements, return_to_stock, take_from_stock
+
+from .balances import post_balance, redate_balance_entries
+from .rollups import line_totals, negated, post_sales, sale_day
+from .models import Sale, SaleItem, Payment, Client, BalanceEntry
+
+
+# Stock and balances are only ever changed with single UPDATE ... SET x = x + n
+# statements, never read-modify-save, so concurrent sales cannot lose updates.
 
 
 @receiver(pre_save, sender=SaleItem)
 def saleitem_pre_save(sender, instance, **kwargs):
     if not instance.pk:
+        instance._old_product_id = instance.product_id
         instance._old_quantity = 0
         instance._old_price = 0
-        return
-
-    old = SaleItem.objects.get(pk=instance.pk)
-    instance._old_quantity = old.quantity
-    instance._old_price = old.sale_price
+        instance._old_cost_price = None
+    else:
+        old = SaleItem.objects.get(pk=instance.pk)
+        instance._old_product_id = old.product_id
+        instance._old_quantity = old.quantity
+        instance._old_price = old.sale_price
+        instance._old_cost_price = old.cost_price
+
+    # Cost of goods sold: the product's weighted-average cost when the line
+    # is sold, kept on later edits so returns go back at the same cost.
+    if not instance.pk or instance.product_id != instance._old_product_id:
+        instance.cost_price = Product.objects.filter(pk=instance.product_id).values_list(
+            'cost_price', flat=True
+        ).first()
 
 
 @receiver(post_save, sender=SaleItem)
 @transaction.atomic
 def saleitem_post_save(sender, instance, created, **kwargs):
-    product = instance.product
-    client = instance.sale.client
+    moment = instance.sale.sale_date
+    if instance.product_id == instance._old_product_id:
+        move_stock(instance.product_id, instance.quantity - instance._old_quantity, instance, instance.cost_price,
+                   moment)
+    else:
+        return_to_stock(instance._old_product_id, instance._old_quantity, instance, instance._old_cost_price,
+                        moment)
+        take_from_stock(instance.product_id, instance.quantity, instance, moment)
+
+    day, client_id = sale_day(moment), instance.sale.client_id
+    old_totals = line_totals(instance._old_quantity, instance._old_price, instance._old_cost_price)
+    totals = line_totals(instance.quantity, instance.sale_price, instance.cost_price)
+    if instance.product_id == instance._old_product_id:
+        delta = tuple(new - old for new, old in zip(totals, old_totals))
+        post_sales(day, client_id, instance.product_id, delta)
+    else:
+        post_sales(day, client_id, instance._old_product_id, negated(old_totals))
+        post_sales(day, client_id, instance.product_id, totals)
 
-    quantity_delta = instance.quantity - instance._old_quantity
     price_delta = (instance.quantity * instance.sale_price) - (
         instance._old_quantity * instance._old_price
     )
+    post_balance(
+        instance.sale.client_id, price_delta, 'sale' if price_delta > 0 else 'return', moment,
+        sale_id=instance.sale_id,
+    )
 
-    product.quantity -= quantity_delta
-    if product.quantity < 0:
-        product.quantity = 0
-    product.save()
-
-    client.balance += price_delta
-    client.save()
+    Sale.objects.filter(pk=instance.sale_id).update(total_amount=F('total_amount') + price_delta)
 
 
 @receiver(post_delete, sender=SaleItem)
+@transaction.atomic
 def saleitem_post_delete(sender, instance, **kwargs):
-    product = instance.product
-    client = instance.sale.client
+    amount = instance.quantity * instance.sale_price
+
+    return_to_stock(instance.product_id, instance.quantity, unit_cost=instance.cost_price,
+                    moment=instance.sale.sale_date)
+    post_sales(
+        sale_day(instance.sale.sale_date), instance.sale.client_id, instance.product_id,
+        negated(line_totals(instance.quantity, instance.sale_price, instance.cost_price)),
+    )
+    post_balance(instance.sale.client_id, -amount, 'return', instance.sale.sale_date, sale_id=instance.sale_id)
+
+    Sale.objects.filter(pk=instance.sale_id).update(total_amount=F('total_amount') - amount)
 
-    product.quantity += instance.quantity
-    product.save()
 
-    client.balance -= instance.quantity * instance.sale_price
-    client.save()
+@receiver(pre_save, sender=Sale)
+def sale_pre_save(sender, instance, **kwargs):
+    instance._old_sale_date = instance._old_client_id = None
+    if not instance._state.adding:
+        instance._old_sale_date, instance._old_client_id = Sale.objects.filter(pk=instance.pk).values_list(
+            'sale_date', 'client_id'
+        ).first() or (None, None)
+
+
+@receiver(post_save, sender=Sale)
+@transaction.atomic
+def sale_post_save(sender, instance, created, **kwargs):
+    if instance._old_sale_date is None:
+        return
+
+    if instance.sale_date != instance._old_sale_date:
+        redate_movements(StockMovement.objects.filter(sale_item__sale=instance), instance.sale_date)
+        redate_balance_entries(BalanceEntry.objects.filter(sale=instance), instance.sale_date)
+
+    old_day, day = sale_day(instance._old_sale_date), sale_day(instance.sale_date)
+    if (old_day, instance._old_client_id) == (day, instance.client_id):
+        return
+
+    # Move the sales of the sale to its new day and client in the rollups.
+    lines = instance.items.values('product').annotate(
+        sold=Sum('quantity'),
+        revenue=Sum(F('quantity') * F('sale_price')),
+        cost=Sum(F('quantity') * Coalesce('cost_price', Value(0, output_field=DecimalField()))),
+    ).values_list('product', 'sold', 'revenue', 'cost').order_by()
+    for product_id, *totals in lines:
+        post_sales(old_day, instance._old_client_id, product_id, negated(totals))
+        post_sales(day, instance.client_id, product_id, tuple(totals))
 
 
 @receiver(post_save, sender=Payment)
@@ -54,13 +127,17 @@ def payment_post_save(sender, instance, created, **kwargs):
     if not created:
         return
 
-    client = instance.client
-    client.balance -= instance.amount
-    client.save()
+    post_balance(instance.client_id, -instance.amount, 'payment', instance.payment_date, payment=instance)
 
 
 @receiver(post_delete, sender=Payment)
 def payment_post_delete(sender, instance, **kwargs):
-    client = instance.client
-    client.balance += instance.amount
-    client.save()
+    post_balance(instance.client_id, instance.amount, 'payment_cancel', instance.payment_date)
+
+
+@receiver(post_save, sender=Client)
+def client_post_save(sender, instance, created, **kwargs):
+    if created and instance.balance:
+        BalanceEntry.objects.create(
+            client=instance, kind='opening', amount=instance.balance, balance_after=instance.balance
+        )
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from apps.main.models import Brand, Country, Product, Warehouse
+from apps.main.stock import InsufficientStock, take_from_stock
+from .models import Client, Payment, Sale, SaleItem
+
+
+PRICE = Decimal('10.00')
+
+
+def retry_when_locked(operation, attempts=50):
+    """SQLite rejects concurrent writers with "database is locked": wait and retry."""
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except OperationalError as error:
+            if 'locked' not in str(error) or attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0.005, 0.05) * (attempt + 1))
+
+
+class ConcurrentSaleTests(TransactionTestCase):
+    """
+    Many threads sell the same product and take payments at once; stock,
+    sales and the client balance must still add up. A TransactionTestCase,
+    so every thread commits on its own connection.
+    """
+    threads = 8
+    sales = 15
+    stock = 60
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Фильтр", quantity=self.stock, cost_price=PRICE,
+            warehouse=Warehouse.objects.create(name="Склад"),
+            brand=Brand.objects.create(name="Bosch"),
+            country_of_origin=Country.objects.create(name="Germany"),
+        )
+        self.client_ = Client.objects.create(full_name="Клиент", phone_number="-")
+
+    def sell(self, quantity):
+        with transaction.atomic():
+            sale = Sale.objects.create(sale_date=timezone.now(), client=self.client_)
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=quantity, sale_price=PRICE)
+
+    def run_concurrently(self):
+        counts = {'sold': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.sales):
+                    try:
+                        retry_when_locked(lambda: self.sell(random.randint(1, 3)))
+                        outcome = 'sold'
+                    except InsufficientStock:
+                        outcome = 'rejected'
+                    if random.random() < 0.3:
+                        retry_when_locked(lambda: Payment.objects.create(client=self.client_, amount=PRICE))
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for future in [pool.submit(worker) for _ in range(self.threads)]:
+                future.result()
+        return counts
+
+    def test_concurrent_sales_add_up(self):
+        counts = self.run_concurrently()
+        # More is asked for than is in stock: some sales must be turned away.
+        self.assertGreater(counts['rejected'], 0)
+
+        items = SaleItem.objects.filter(product=self.product)
+        sold = items.aggregate(total=Sum('quantity', default=0))['total']
+        billed = items.aggregate(total=Sum(F('quantity') * F('sale_price'), default=0))['total']
+        paid = Payment.objects.filter(client=self.client_).aggregate(total=Sum('amount', default=0))['total']
+        self.product.refresh_from_db()
+        self.client_.refresh_from_db()
+
+        self.assertEqual(items.count(), counts['sold'])
+        self.assertGreaterEqual(self.product.quantity, 0)
+        self.assertEqual(self.product.quantity, self.stock - sold)
+        self.assertEqual(self.product.movements.aggregate(total=Sum('quantity'))['total'], self.product.quantity)
+        self.assertEqual(self.product.sales_days.aggregate(total=Sum('quantity'))['total'], sold)
+
+        self.assertEqual(self.client_.balance, billed - paid)
+        self.assertEqual(self.client_.sales_days.aggregate(total=Sum('revenue'))['total'], billed)
+        self.assertEqual(self.client_.balance_entries.aggregate(total=Sum('amount'))['total'], self.client_.balance)
+        last_entry = self.client_.balance_entries.order_by('-created_at', '-pk').first()
+        self.assertEqual(last_entry.balance_after, self.client_.balance)
+
+        self.assertFalse(
+            Sale.objects.filter(client=self.client_)
+            .exclude(total_amount=F('items__quantity') * F('items__sale_price'))
+            .exists()
+        )
+
+    def test_oversell_is_rejected(self):
+        with self.assertRaises(InsufficientStock):
+            take_from_stock(self.product.pk, self.stock + 1)
+        with self.assertRaises(InsufficientStock):
+            self.sell(self.stock + 1)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, self.stock)
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(self.product.movements.aggregate(total=Sum('quantity'))['total'], self.stock)
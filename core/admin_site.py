@@ -1,12 +1,13 @@
 from django.contrib.admin import AdminSite
-from apps.main.models import CurrencyRate
+from django.utils.functional import SimpleLazyObject
+from apps.main.currency import get_currency_context
 
 class MyAdminSite(AdminSite):
     site_header = "Car Parts Admin"
 
     def each_context(self, request):
         context = super().each_context(request)
-        context['currencies'] = CurrencyRate.objects.all()
+        context['currencies'] = SimpleLazyObject(lambda: get_currency_context().rates)
         context['current_currency'] = request.session.get('admin_currency', 'USD')
         return context
 
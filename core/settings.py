@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.main.middleware.CurrencyContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,10 +87,63 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS=10000
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite profile for several worker processes: with WAL readers (exports)
+# no longer block writers, a writer waits up to busy_timeout ms for the lock
+# instead of failing with "database is locked", and IMMEDIATE transactions
+# take the write lock up front rather than failing on the upgrade from a read.
+# `manage.py benchmark_sqlite` compares it with the plain SQLite defaults.
+SQLITE_PRODUCTION = config("SQLITE_PRODUCTION", default=True, cast=bool)
+SQLITE_PRAGMAS = {
+    'journal_mode': config("SQLITE_JOURNAL_MODE", default='WAL'),
+    'synchronous': config("SQLITE_SYNCHRONOUS", default='NORMAL'),
+    'mmap_size': config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    'cache_size': config("SQLITE_CACHE_SIZE", default=-64 * 1024, cast=int),  # negative: KiB
+    'busy_timeout': config("SQLITE_BUSY_TIMEOUT", default=10000, cast=int),
+    'temp_store': 'MEMORY',
+}
+SQLITE_OPTIONS = {
+    'init_command': ''.join(f'PRAGMA {name}={value};' for name, value in SQLITE_PRAGMAS.items()),
+    'transaction_mode': config("SQLITE_TRANSACTION_MODE", default='IMMEDIATE'),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS if SQLITE_PRODUCTION else {},
+    }
+}
+
+# DATABASE_ENGINE=postgresql switches to PostgreSQL, for several concurrent
+# writers. Each worker process keeps a psycopg pool of up to
+# POSTGRES_POOL_MAX_SIZE connections; with POSTGRES_POOL=False it keeps one
+# persistent connection per thread for POSTGRES_CONN_MAX_AGE seconds instead
+# (Django does not allow both). See apps.main.search for its trigram indexes.
+if config("DATABASE_ENGINE", default='sqlite') == 'postgresql':
+    POSTGRES_POOL = config("POSTGRES_POOL", default=True, cast=bool)
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config("POSTGRES_DB", default='car_parts'),
+        'USER': config("POSTGRES_USER", default='postgres'),
+        'PASSWORD': config("POSTGRES_PASSWORD", default=''),
+        'HOST': config("POSTGRES_HOST", default='localhost'),
+        'PORT': config("POSTGRES_PORT", default=5432, cast=int),
+        'CONN_MAX_AGE': 0 if POSTGRES_POOL else config("POSTGRES_CONN_MAX_AGE", default=600, cast=int),
+        'CONN_HEALTH_CHECKS': not POSTGRES_POOL,
+        'OPTIONS': {
+            'pool': {
+                'min_size': config("POSTGRES_POOL_MIN_SIZE", default=2, cast=int),
+                'max_size': config("POSTGRES_POOL_MAX_SIZE", default=10, cast=int),
+                'timeout': config("POSTGRES_POOL_TIMEOUT", default=10, cast=int),
+            },
+        } if POSTGRES_POOL else {},
+    }
+
+# Shared by all worker processes, e.g. for the currency rate registry.
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config("CACHE_LOCATION", default=str(BASE_DIR / '.cache')),
     }
 }
 
@@ -132,6 +186,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads used by `manage.py run_report_worker` to build background reports.
+REPORT_JOB_WORKERS = config("REPORT_JOB_WORKERS", default=2, cast=int)
+# Seconds without progress after which a running report counts as abandoned.
+REPORT_JOB_TIMEOUT = config("REPORT_JOB_TIMEOUT", default=900, cast=int)
+
 CORS_ALLOWED_ORIGINS = json.loads(config("CORS_ALLOWED_ORIGINS"))
 CORS_ALLOW_CREDENTIALS = True
 CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS
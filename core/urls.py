@@ -20,14 +20,17 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
 
-from apps.main.views import set_admin_currency, product_autofill
+from apps.main.views import set_admin_currency, product_autofill, product_autocomplete, report_job_download
 
 
 urlpatterns = [
     # path('admin/', lambda request: redirect('/admin/main/product/')),
     path('admin/', admin.site.urls),
     path("set-admin-currency/", set_admin_currency, name="set_admin_currency"),
+    path("product-autofill/", product_autofill, name="product_autofill_batch"),
     path("product-autofill/<int:pk>/", product_autofill, name="product_autofill"),
+    path("product-autocomplete/", product_autocomplete, name="product_autocomplete"),
+    path("report-jobs/<int:pk>/download/", report_job_download, name="report_job_download"),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,50 @@
+// Batches product autofill lookups: every id asked for in the same tick is
+// fetched with one /product-autofill/?ids=... request and cached per page.
+// Results of /product-autocomplete/ carry the data themselves; this is for
+// selections made through other product selects.
+window.ProductAutofill = (function () {
+    const cache = new Map();   // id -> Promise of autofill data
+    let pending = new Map();   // id -> {resolve, reject} waiting for the next batch
+    let scheduled = false;
+
+    function flush() {
+        const batch = pending;
+        pending = new Map();
+        scheduled = false;
+
+        const ids = Array.from(batch.keys());
+        fetch(`/product-autofill/?ids=${ids.join(",")}`)
+            .then(res => res.json())
+            .then(data => {
+                batch.forEach((callbacks, id) => {
+                    const product = data.products[id];
+                    if (product) {
+                        callbacks.resolve(product);
+                    } else {
+                        cache.delete(id);
+                        callbacks.reject(new Error(`Product ${id} not found`));
+                    }
+                });
+            })
+            .catch(error => {
+                batch.forEach((callbacks, id) => {
+                    cache.delete(id);
+                    callbacks.reject(error);
+                });
+            });
+    }
+
+    function get(id) {
+        id = String(id);
+        if (!cache.has(id)) {
+            cache.set(id, new Promise((resolve, reject) => pending.set(id, {resolve, reject})));
+            if (!scheduled) {
+                scheduled = true;
+                setTimeout(flush, 0);
+            }
+        }
+        return cache.get(id);
+    }
+
+    return {get};
+})();
@@ -0,0 +1,6 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const active = document.querySelector('.report-job-status[data-active="1"]');
+    if (!active) return;
+
+    setTimeout(() => location.reload(), 3000);
+});
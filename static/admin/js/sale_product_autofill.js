@@ -1,3 +1,11 @@
+function fillSaleRow(row, data) {
+    const sale_price = row.querySelector('input[name$="-sale_price"]');
+    const article_number = row.querySelector('input[name$="-article_number"]');
+
+    if (sale_price) sale_price.value = data.cost_price || "";
+    if (article_number) article_number.value = data.article_number || "";
+}
+
 $(document).on("select2:select", "select", function (e) {
     const select = e.target;
 
@@ -6,16 +14,14 @@ $(document).on("select2:select", "select", function (e) {
     const row = select.closest("tr.form-row");
     if (!row) return;
 
-    const productId = e.params?.data?.id;
-    if (!productId) return;
+    const data = e.params?.data;
+    if (!data?.id) return;
+
+    // Results of /product-autocomplete/ already carry the autofill data.
+    if ("cost_price" in data) {
+        fillSaleRow(row, data);
+        return;
+    }
 
-    fetch(`/product-autofill/${productId}/`)
-        .then(res => res.json())
-        .then(data => {
-            const sale_price = row.querySelector('input[name$="-sale_price"]');
-            const article_number = row.querySelector('input[name$="-article_number"]');
-            
-            if (sale_price) sale_price.value = data.cost_price || "";
-            if (article_number) article_number.value = data.article_number || "";
-        });
+    ProductAutofill.get(data.id).then(data => fillSaleRow(row, data));
 });